@@ -1,5 +1,7 @@
 import operator
 import itertools
+import numpy as np
+from intcode_batch import run_batch
 
 def step_intcode(src, i):
     """Take a step in an intcode program
@@ -57,10 +59,18 @@ def day02(inp, nounverb=(12, 2)):
     return src[0]
 
 def day02b(inp):
-    for n,v in itertools.product(range(100), repeat=2):
-        if day02(inp, nounverb=(n,v)) == 19690720:
-            return 100 * n + v
-    assert False, 'No day 2 solution...'
+    src = list(map(int, inp.strip().split(',')))
+
+    # run every noun-verb pair in lockstep
+    nounverbs = np.array(list(itertools.product(range(100), repeat=2)))
+    programs = np.tile(src, (len(nounverbs), 1))
+    programs[:, 1:3] = nounverbs
+    _, memory = run_batch(programs)
+
+    hits = nounverbs[memory[:, 0] == 19690720]
+    assert hits.size, 'No day 2 solution...'
+    n,v = hits[0].tolist()
+    return 100 * n + v
 
 if __name__ == "__main__":
     testinp = open('day02.testinp').read()
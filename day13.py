@@ -1,150 +1,38 @@
 import numpy as np
-import operator
-from itertools import chain, cycle, permutations
-from collections import deque, defaultdict
-
-class Intcode:
-    ops = {1: operator.add,
-           2: operator.mul,
-           3: 'in',
-           4: 'out',
-           5: 'jmpif',
-           6: 'jmpifn',
-           7: lambda i,j: int(i < j),
-           8: lambda i,j: int(i == j),
-           9: 'rebase',
-           99: None,  # signal exit
-           }
-
-    def __init__(self, src, inputs=None):
-        self.src = defaultdict(int)
-        self.src.update(enumerate(src))
-        self.ip = 0
-        self.base = 0
-        self.pipe = None  # potential instance to pipe output into
-        if not inputs:
-            inputs = deque([])
-        self.inputs = deque(inputs)
-        self.outputs = []
-        self.last_op = None
-
-    def export_state(self):
-        return self.src.copy(), self.ip, self.base, self.inputs.copy(), self.outputs.copy(), self.last_op
-
-    def import_state(self, state):
-        src, self.ip, self.base, inputs, outputs, self.last_op = state
-        self.src = src.copy()
-        self.inputs = inputs.copy()
-        self.outputs = outputs.copy()
-
-    def pipe_into(self, other):
-        self.pipe = other
-
-    @staticmethod
-    def modes_from_op(opval):
-        """Decode parameter modes into binary ints"""
-        parammodes = chain(map(int, reversed(str(opval//100))), cycle([0])) # 1 for value, 0 for pointer
-        return parammodes
+from collections import deque
+from intcode import Intcode, OutputChannel, Status
+
+class Screen(OutputChannel):
+    """Game state kept up to date from (x, y, tile) output records"""
+    def __init__(self):
+        super().__init__(3)
+        self.board = {}  # (x, y) -> tile
+        self.score = 0
+        self.ball = None  # last (x, y) of the ball
+        self.paddle = None  # last (x, y) of the paddle
+        self.ball_rows = {}  # y -> last x of the ball in that row
+
+    def emit(self, record):
+        x,y,t = record
+        if (x,y) == (-1,0):
+            self.score = t
+            return
+        self.board[x,y] = t
+        if t == 4:
+            self.ball = x,y
+            self.ball_rows[y] = x
+        elif t == 3:
+            self.paddle = x,y
+
+    def copy(self):
+        other = super().copy()
+        other.board = self.board.copy()
+        other.ball_rows = self.ball_rows.copy()
+        return other
 
     @property
-    def next_op(self):
-        """Peek at the next input instruction"""
-        return self.ops[self.src[self.ip] % 100]
-
-    def step(self):
-        """Take a step in the intcode program"""
-        src = self.src
-        ip = self.ip
-    
-        opval = src[ip]
-    
-        opcode = opval % 100
-        if opcode == 99:
-            n_inps = 0
-            n_outs = 0
-        elif opcode in [1, 2]:
-            n_inps = 2
-            n_outs = 1
-        elif opcode == 3:
-            n_inps = 0
-            n_outs = 1
-        elif opcode == 4:
-            n_inps = 1
-            n_outs = 0
-        elif opcode in [5, 6]:
-            n_inps = 2
-            n_outs = 0
-        elif opcode in [7, 8]:
-            n_inps = 2
-            n_outs = 1
-        elif opcode == 9:
-            n_inps = 1
-            n_outs = 0
-        else:
-            assert False, f'Invalid opcode {opcode} at position {ip}!'
-    
-        op = self.ops.get(opcode, -1)
-        assert op != -1, f'Need to implement more operations in ops dict!'
-
-        self.last_op = op
-    
-        parammodes = self.modes_from_op(opval)
-        params = []
-        for k,mode in zip(range(ip + 1, ip + 1 + n_inps), parammodes):
-            if mode == 0:
-                index = src[k]
-            elif mode == 1:
-                index = k
-            elif mode == 2:
-                index = self.base + src[k]
-            else:
-                assert False, f'Invalid parameter mode {mode}!'
-            assert index >= 0, f'Invalid input index {index}!'
-
-            param = src[index]
-            params.append(param)
-
-        if n_outs:
-            output_mode = next(parammodes)
-            if output_mode == 0:
-                ip_out = src[ip + 1 + n_inps]
-            elif output_mode == 2:
-                ip_out = self.base + src[ip + 1 + n_inps]
-            else:
-                assert False, 'What does output_mode == 1 mean?'
-
-            assert ip_out >= 0, f'Invalid output index {ip_out}!'
-        else:
-            ip_out = None
-
-        # handle "input"
-        if op == "in":
-            src[ip_out] = self.inputs.popleft()
-
-        # handle relative base offset
-        if op == 'rebase':
-            offset = params[0]
-            self.base += offset
-
-        # handle jumps, increment intruction pointer
-        if (op == 'jmpif' and params[0]) or (op == 'jmpifn' and not params[0]):
-            self.ip = params[1]
-        else:
-            self.ip += 1 + n_inps + n_outs
-    
-        # handle "output"
-        if op == "out":
-            # value is params[0]
-            res = params[0]
-            self.outputs.append(res)
-            if self.pipe:
-                self.pipe.inputs.append(res)
-    
-        # compute values for callables
-        if callable(op):
-            src[ip_out] = op(*params)
-
-        return
+    def blocks(self):
+        return sum(1 for typ in self.board.values() if typ == 2)
 
 class Solver:
     def __init__(self, src):
@@ -155,69 +43,72 @@ class Solver:
         self.total_blocks = None  # number of initial blocks; part 1
         self.blocks_left = -1  # countdown until end of game
         self.idle_steps = 10  # incremented steps to stand in one place for the next move
-        self.checkpoint = None  # state of the interpreter in a safe state
-        self.steps = 0  # steps taken for checkpoint
+        self.game = Intcode(src, outputs=Screen())
+        self.game.enable_journal()  # logs inputs so that we can rewind to the checkpoint
+        self.steps = 0  # steps taken for checkpoint: inputs consumed in a safe state
         self.paddley = None  # constant y position of the paddle
 
     def find_next_choice(self):
         # first stand still, check where ball exits
-        instance = Intcode(self.src)
-        if self.checkpoint:
-            # load state from checkpoint
-            instance.import_state(self.checkpoint)
+        # rewind to the checkpoint, this also drops the noisy inputs of idle steps
+        instance = self.game
+        instance.rewind_to(self.steps)
 
-        # but always override inputs (checkpoint inputs are noisy due to idle steps)
-        instance.inputs.clear()
-        instance.inputs.extend(self.choices[self.steps:] + [0]*self.idle_steps)
+        # feed inputs one at a time to be able to check the state after each input
+        pending = deque(self.choices[self.steps:] + [0]*self.idle_steps)
 
+        screen = instance.outputs
         steps = self.steps
         while True:
-            try:
-                instance.step()
-            except IndexError:
+            status = instance.run(until={'input', 'halt'})
+            if status is Status.HALTED:
+                if steps > self.steps:
+                    break
+                continue
+
+            if not pending:
                 # retry with more steps of standing still
                 self.idle_steps *= 10
                 return
-            
-            if instance.last_op is None and steps > self.steps:
-                break
+
+            # consume a single input
+            instance.inputs.append(pending.popleft())
+            instance.step()
 
             if not self.simulating and instance.last_op == 'in':
                 self.simulating = True
                 # count number of initial blocks
-                self.total_blocks = count_blocks(instance.outputs)
+                self.total_blocks = screen.blocks
 
                 # assumption: paddle y component is constant, store that too
-                self.paddley = next(y for t,y,x in zip(*[reversed(instance.outputs)]*3) if t == 3)
+                self.paddley = screen.paddle[1]
 
             if instance.last_op == 'in':
                 # check state when input is requested for consistent ball-and-paddle state
                 steps += 1
 
-                ballx,bally = next((x,y) for t,y,x in zip(*[reversed(instance.outputs)]*3) if t == 4 and (x,y) != (-1,0))
-
+                ballx,bally = screen.ball
 
                 # check if we hit it; if yes: checkpoint
                 if bally == self.paddley - 1:
-                    paddlex = next(x for t,y,x in zip(*[reversed(instance.outputs)]*3) if t == 3 and (x,y) != (-1,0))
+                    paddlex = screen.paddle[0]
 
                     if ballx == paddlex:
-                        self.checkpoint = instance.export_state()
                         self.steps = steps
                         self.choices = (self.choices + [0]*self.idle_steps)[:self.steps]
                         return
 
-        self.blocks_left = count_blocks(instance.outputs)
+        self.blocks_left = screen.blocks
         if not self.blocks_left:
             # then we've won, need final score
-            self.score = next(s for s,y,x in zip(*[reversed(instance.outputs)]*3) if (x,y) == (-1,0))
+            self.score = screen.score
             return
 
         # find where the paddle was when we died
-        paddlex = next(x for t,y,x in zip(*[reversed(instance.outputs)]*3) if t == 3 and (x,y) != (-1,0))
+        paddlex = screen.paddle[0]
 
         # find where the ball was above the paddle's level
-        ballx = next(x for t,y,x in zip(*[reversed(instance.outputs)]*3) if (t,y) == (4, self.paddley - 1))
+        ballx = screen.ball_rows[self.paddley - 1]
 
         diff = ballx - paddlex
         sign = np.sign(diff)
@@ -228,13 +119,8 @@ class Solver:
         
         return
 
-def count_blocks(outputs):
-    board = {(x,y):t for x,y,t in zip(*[iter(outputs)]*3) if (x,y) != (-1,0)}
-    return sum(1 for typ in board.values() if typ == 2)
-
-def print_board(outputs):
+def print_board(board):
     mapping = np.array([' ', '=', '#', '\N{em dash}', 'o'])
-    board = {(x,y):t for x,y,t in zip(*[iter(outputs)]*3) if (x,y) != (-1,0)}
     points = np.array(list(board.keys()))
     size = points.ptp(0) + 1
     mins = points.min(0)
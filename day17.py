@@ -3,11 +3,11 @@ import numpy as np  # convenience, not necessity
 from intcode import Intcode
 
 def parse_outputs(outputs):
-    """Parse ascii-encoded output into a board dict"""
+    """Parse the text output into a board dict"""
     board = defaultdict(lambda:'.')  # '.' is space, '#' is ledge, '^>v<' is robot
     pos = [0,0]
     # using these indices pos[0] is the "left" distance, pos[1] is the "top" distance
-    for c in bytes(outputs).decode('ascii'):
+    for c in outputs:
         if c == '\n':
             pos[0] += 1
             pos[1] = 0
@@ -82,7 +82,7 @@ def partition_path(walkpath, max_len=20):
     Since the configuration space is quite limited, even the dumb
     triple loop should finish quite fast.
 
-    Returns: the full input commands to be sent, as bytes
+    Returns: the full input commands to be sent, as lines of text
     """
 
     # longest possible subroutine: uses single digits,
@@ -139,7 +139,7 @@ def partition_path(walkpath, max_len=20):
                         break
                 else:
                     # we've won!
-                    return '\n'.join([','.join(subroutines), Astr, Bstr, Cstr, 'n\n']).encode('ascii')
+                    return '\n'.join([','.join(subroutines), Astr, Bstr, Cstr, 'n'])
 
     # if we're here: we've run out of options
     assert False, 'No solution to the path partitioning!'
@@ -151,12 +151,7 @@ def simulate(src, outputs=None):
 
         # live input, simulate board (otherwise take from input)
         comp = Intcode(src)
-
-        while True:
-            comp.step()
-            if comp.last_op in [None, 'in']:
-                break
-        outputs = comp.outputs
+        outputs = comp.read_until_prompt()
     else:
         testing = True
 
@@ -177,17 +172,14 @@ def simulate(src, outputs=None):
 
     if testing:
         # just print the command
-        print(commands.decode('ascii'))  # comment this to stop the test command from being printed
+        print(commands)  # comment this to stop the test command from being printed
         dust = None
     else:
         assert src[0] == 1
         src[0] = 2
         comp = Intcode(src)
-        comp.inputs.extend(commands)
-        while True:
-            comp.step()
-            if comp.last_op is None:
-                break
+        comp.send_line(commands)
+        comp.run(until={'halt'})
         dust = comp.outputs[-1]
 
     return score, dust
@@ -204,7 +196,7 @@ def print_board(board):
 def day17(inp, testing=False):
     if testing:
         # output is passed as input, don't simulate
-        part12 = simulate(None, outputs=inp.encode('ascii'))
+        part12 = simulate(None, outputs=inp)
     else:
         src = list(map(int, inp.strip().split(',')))
         part12 = simulate(src)
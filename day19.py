@@ -1,15 +1,10 @@
 from itertools import product,count
 import numpy as np  # only for plotting
-from intcode import Intcode
+from intcode_cache import RunCache
 
-def get_traction(src, x, y):
-    comp = Intcode(src)
-
-    comp.inputs.extend([x, y])
-    while True:
-        comp.step()
-        if comp.last_op == 'out':
-            return comp.outputs[-1]
+def get_traction(probe, x, y):
+    # probe is a RunCache of the drone program
+    return probe.run([x, y])[-1]
 
 def print_board(board):
     points = np.array(list(board.keys()))
@@ -20,8 +15,11 @@ def print_board(board):
     print('\n'.join([''.join([c for c in row]) for row in pixels.T.astype(str)]))
     print()
 
-def day19(inp, patchsize=50, findsize=100):
+def day19(inp, patchsize=50, findsize=100, cache_path=None):
     src = list(map(int, inp.strip().split(',')))
+    # memoize probes, on disk too if there's a cache_path,
+    # and run counted loops of the probe in closed form
+    probe = RunCache(src, path=cache_path, accelerate=True)
 
     # manually special-case top 3x3 where there's a hole,
     # assume no more holes
@@ -40,7 +38,7 @@ def day19(inp, patchsize=50, findsize=100):
 
         x = bounds[y - 1][0]
         while True:
-            is_tract = get_traction(src, x, y)
+            is_tract = get_traction(probe, x, y)
             board[x,y] = is_tract
 
             if y in bounds and not is_tract and (x-1,y) not in board:
@@ -55,6 +53,7 @@ def day19(inp, patchsize=50, findsize=100):
                 if y > min(bounds) + findsize and  bounds[y - findsize + 1][1] >= bounds[y][0] + findsize - 1:
                     # then we can fit the ship in, done
                     x0,y0 = bounds[y][0], y - findsize + 1
+                    probe.close()
                     return tracts, 10000*x0 + y0
                 break
 
@@ -72,4 +71,4 @@ def day19(inp, patchsize=50, findsize=100):
 
 if __name__ == "__main__":
     inp = open('day19.inp').read()
-    print(day19(inp))
+    print(day19(inp, cache_path='day19.cache'))
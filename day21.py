@@ -1,23 +1,19 @@
 from intcode import Intcode
 
-def simulate(src):
+def simulate(comp):
     inputs = '\n'.join([
         'NOT C J',
         'AND D J',
         'NOT A T',
         'OR T J',
-        'WALK\n'])
-    comp = Intcode(src)
-    comp.inputs.extend(inputs.encode('ascii'))
-
-    while True:
-        comp.step()
-        if comp.last_op is None:
-            break
+        'WALK'])
+    comp.reset()
+    comp.send_line(inputs)
+    comp.run(until={'halt'})
     if comp.outputs[-1] > 255:
         return comp.outputs[-1]
 
-def simulate_part2(src):
+def simulate_part2(comp):
     inputs = '\n'.join([
         # jump if D and H are valid
         'OR D T',
@@ -35,23 +31,21 @@ def simulate_part2(src):
         # always jump if A is empty
         'NOT A T',
         'OR T J',
-        'RUN\n'])
+        'RUN'])
 
-    comp = Intcode(src)
-    comp.inputs.extend(inputs.encode('ascii'))
-
-    while True:
-        comp.step()
-        if comp.last_op is None:
-            break
+    comp.reset()
+    comp.send_line(inputs)
+    comp.run(until={'halt'})
     if comp.outputs[-1] > 255:
         return comp.outputs[-1]
 
 def day21(inp):
     src = list(map(int, inp.strip().split(',')))
 
-    part1 = simulate(src)
-    part2 = simulate_part2(src)
+    # both parts share the prompt and the compiled code
+    comp = Intcode.prepare(src, compiled=True)
+    part1 = simulate(comp)
+    part2 = simulate_part2(comp)
 
     return part1,part2
 
@@ -1,62 +1,85 @@
+import re
 from intcode import Intcode
+from intcode_search import Search
 
-def simulate(src):
+def simulate(src, save_path='day25.save'):
     comp = Intcode(src)
 
     dirs = {'n': 'north', 'e': 'east', 's': 'south', 'w': 'west', 'i': 'inv'}
-    
-    last_output_len = 0
+
     while True:
-        if comp.next_op == 'in':
-            new_outputs = comp.outputs[last_output_len:]
-            last_output_len = len(comp.outputs)
-            # print console
-            print(bytes(new_outputs).decode('ascii'))
+        text = comp.read_until_prompt()
+        if comp.last_op is None:
+            # the program halted
+            return text
 
-            while True:
-                # get a choice: north/east/south/west | take <thing> | drop <thing> | inv
-                # the single-word commands only need the first letter
-                choice = input()
-                choice = choice.lower()
-                if choice.startswith('q'):
-                    print('Quitting simulation...')
-                    return ''
-                if choice.startswith(tuple('nsewi')):
-                    choice = dirs[choice[0]]
-                    break
-                if choice.split()[0] not in ['take', 'drop']:
-                    print('Invalid input!')
-                    continue
+        # the program waits for a command, print console
+        print(text)
+
+        while True:
+            # get a choice: north/east/south/west | take <thing> | drop <thing> | inv
+            #               | save | load (the game state to/from save_path)
+            # the single-word commands only need the first letter
+            choice = input()
+            choice = choice.lower()
+            if choice.startswith('q'):
+                print('Quitting simulation...')
+                return ''
+            if choice in ['save', 'load']:
+                if choice == 'save':
+                    with open(save_path, 'wb') as f:
+                        f.write(comp.to_bytes())
+                else:
+                    with open(save_path, 'rb') as f:
+                        comp = Intcode.from_bytes(f.read())
+                print(f'Game {choice}ed.')
+                continue
+            if choice.startswith(tuple('nsewi')):
+                choice = dirs[choice[0]]
                 break
+            if choice.split()[0] not in ['take', 'drop']:
+                print('Invalid input!')
+                continue
+            break
 
-            next_inp = f'{choice}\n'.encode('ascii')
-            comp.inputs.extend(next_inp)
-            
-            # now step over the corresponding input instructions
-            read_count = 0
-            while True:
-                comp.step()
-                if comp.last_op == 'in':
-                    read_count += 1
+        comp.send_line(choice)
 
-                if read_count == len(next_inp):
-                    break
+def list_section(text, title):
+    """Return the '- item' lines following a title line of the game's text"""
+    match = re.search(rf'^{title}\n((?:- .*\n)+)', text, re.M)
+    return [line[2:] for line in match[1].splitlines()] if match else []
 
-        comp.step()
+def explore(src, budget=10**6):
+    """Search the game for the password: walk through doors, take items
 
-        if comp.last_op is None:
-            return bytes(comp.outputs[last_output_len:]).decode('ascii')
+    Items that end the game are pruned, and so are the ones that make the
+    program run longer than `budget` instructions for a single command.
+    Returns the password as text, None if it's not found.
+    """
+    def commands(node):
+        text = node.text
+        return (list_section(text, 'Doors here lead:')
+                + [f'take {item}' for item in list_section(text, 'Items here:')])
 
-def day25(inp):
-    src = list(map(int, inp.strip().split(',')))
+    def lost(node):
+        return node.comp.last_op is None and 'keypad' not in node.text
+
+    node = Search(src, commands, prune=lost, budget=budget).find(lambda node: 'keypad' in node.text)
+    if node:
+        return re.search(r'typing (\d+) on the keypad', node.text)[1]
 
-    pwd = simulate(src)
+def day25(inp, interactive=True):
+    src = list(map(int, inp.strip().split(',')))
 
-    return pwd
+    if interactive:
+        return simulate(src)
+    # automatic search, only checked against a synthetic adventure so far
+    return explore(src)
 
 if __name__ == "__main__":
+    import sys
     inp = open('day25.inp').read()
-    print(day25(inp))
+    print(day25(inp, interactive='--explore' not in sys.argv))
     # strategy: first find the necessary heaviest (boulder),
     #           exclude the second heaviest (mutex),
     #           exclude each of the remaining six items one at a time
@@ -1,8 +1,310 @@
+import copy
+import json
 import operator
-from itertools import chain, cycle
-from collections import deque, defaultdict
+import struct
+import sys
+import time
+from array import array
+from enum import Enum
+from itertools import chain, count, cycle
+from collections import Counter, deque, defaultdict
+
+class PagedMemory:
+    """Sparse intcode memory made of lazily allocated int64 pages
+
+    Can be used in place of the default defaultdict(int) memory: unset
+    cells read as 0. Copies are copy-on-write: pages are shared between the
+    copies until one of them writes to a page. Values that don't fit in
+    64 bits are kept in a separate dict, their cell in the page holds the
+    marker value `big_marker`.
+    """
+    __slots__ = ('pages', 'big', 'owned')
+    page_bits = 10  # 1024 cells per page
+    big_marker = -2**63
+
+    def __init__(self, values=()):
+        self.pages = {}  # page index -> array of cells
+        self.big = {}  # address -> value for values that overflow int64
+        self.owned = set()  # indices of pages not shared with copies
+        self.update(values)
+
+    def __getitem__(self, addr):
+        page = self.pages.get(addr >> self.page_bits)
+        if page is None:
+            return 0
+        val = page[addr & ((1 << self.page_bits) - 1)]
+        if val == self.big_marker:
+            return self.big[addr]
+        return val
+
+    def __setitem__(self, addr, val):
+        index = addr >> self.page_bits
+        page = self.pages.get(index)
+        if page is None:
+            page = self.pages[index] = array('q', bytes(8 << self.page_bits))
+            self.owned.add(index)
+        elif index not in self.owned:
+            # copy a shared page before the first write
+            page = self.pages[index] = array('q', page)
+            self.owned.add(index)
+        offset = addr & ((1 << self.page_bits) - 1)
+        if page[offset] == self.big_marker:
+            del self.big[addr]
+        if self.big_marker < val < -self.big_marker:
+            page[offset] = val
+        else:
+            page[offset] = self.big_marker
+            self.big[addr] = val
+
+    def update(self, values):
+        """Set cells from a mapping or from (address, value) pairs"""
+        if hasattr(values, 'items'):
+            values = values.items()
+        for addr,val in values:
+            self[addr] = val
+
+    def __eq__(self, other):
+        if not isinstance(other, PagedMemory):
+            return NotImplemented
+        return self.pages == other.pages and self.big == other.big
+
+    def items(self):
+        """Yield (address, value) pairs for every cell of every allocated page"""
+        for index,page in sorted(self.pages.items()):
+            start = index << self.page_bits
+            for offset in range(len(page)):
+                yield start + offset, self[start + offset]
+
+    def copy(self):
+        """Return a copy-on-write copy of the memory"""
+        other = PagedMemory()
+        other.pages = self.pages.copy()
+        other.big = self.big.copy()
+        # every page is shared now
+        self.owned = set()
+        return other
+
+class OutputChannel:
+    """Output stream of an intcode machine framed into fixed-size records
+
+    Can be used in place of the default outputs list: values are collected
+    until a record of `size` values is complete, then the record (a tuple)
+    is passed to `on_record` if given, otherwise it's appended to a ring
+    buffer holding the last `maxlen` records. Either way memory doesn't
+    grow with the number of outputs (unless maxlen is None).
+
+    Subclasses can override emit() to consume records; copy() has to copy
+    any state they keep, since forked machines copy their outputs.
+    """
+    __slots__ = ('size', 'partial', 'records', 'on_record')
+
+    def __init__(self, size=1, maxlen=None, on_record=None):
+        self.size = size
+        self.partial = []  # values of the record in progress
+        self.records = deque(maxlen=maxlen)
+        self.on_record = on_record
+
+    def append(self, val):
+        partial = self.partial
+        partial.append(val)
+        if len(partial) == self.size:
+            record = tuple(partial)
+            partial.clear()
+            self.emit(record)
+
+    def emit(self, record):
+        """Handle a complete record"""
+        if self.on_record:
+            self.on_record(record)
+        else:
+            self.records.append(record)
+
+    def drain(self):
+        """Return the buffered records and clear the buffer"""
+        records = list(self.records)
+        self.records.clear()
+        return records
+
+    def clear(self):
+        self.partial.clear()
+        self.records.clear()
+
+    def copy(self):
+        """Return a copy with its own buffers (on_record is shared)"""
+        other = copy.copy(self)
+        other.partial = self.partial.copy()
+        other.records = self.records.copy()
+        return other
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+# serialized machine states, see Intcode.to_bytes
+state_magic = b'INTC'
+state_version = 1
+state_header = struct.Struct('<4sBqqqqB')  # magic, version, ip, base, steps, text_pos, last opcode
+
+# binary traces, see Intcode.enable_tracing
+trace_magic = b'ITRC'
+trace_version = 2
+trace_header = struct.Struct('<4sB3x')  # magic, version, padding to align the records
+trace_fields = ('decoded', 'base', 'value')  # int64 each
+trace_table_fields = ('ip', 'opcode', 'read1', 'rel1', 'read2', 'rel2', 'write', 'relw')  # int64 each
+
+def int64_bytes(values):
+    """Little-endian bytes of an int64 array"""
+    if sys.byteorder == 'big':
+        values = array('q', values)
+        values.byteswap()
+    return values.tobytes()
+
+def clamp64(value):
+    """Closest int64 to value"""
+    return max(-2**63, min(2**63 - 1, value))
+
+def int64_array(buf):
+    """int64 array from little-endian bytes"""
+    values = array('q')
+    values.frombytes(buf)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def pack_big(big):
+    """Bytes of an {index: int} dict of values that don't fit in int64"""
+    parts = [struct.pack('<q', len(big))]
+    for index,val in sorted(big.items()):
+        raw = val.to_bytes((val.bit_length() + 8) // 8, 'little', signed=True)
+        parts.append(struct.pack('<qq', index, len(raw)))
+        parts.append(raw)
+    return b''.join(parts)
+
+def unpack_big(buf, pos):
+    """Inverse of pack_big, return the dict and the position after it"""
+    n, = struct.unpack_from('<q', buf, pos)
+    pos += 8
+    big = {}
+    for _ in range(n):
+        index, size = struct.unpack_from('<qq', buf, pos)
+        pos += 16
+        big[index] = int.from_bytes(buf[pos:pos + size], 'little', signed=True)
+        pos += size
+    return big, pos
+
+def pack_ints(values):
+    """Bytes of a sequence of ints: count, int64 values, then the big ones"""
+    marker = PagedMemory.big_marker
+    cells = array('q', bytes(8*len(values)))
+    big = {}
+    for k,val in enumerate(values):
+        if marker < val < -marker:
+            cells[k] = val
+        else:
+            cells[k] = marker
+            big[k] = val
+    return struct.pack('<q', len(values)) + int64_bytes(cells) + pack_big(big)
+
+def unpack_ints(buf, pos):
+    """Inverse of pack_ints, return the list and the position after it"""
+    n, = struct.unpack_from('<q', buf, pos)
+    pos += 8
+    values = int64_array(buf[pos:pos + 8*n]).tolist()
+    big, pos = unpack_big(buf, pos + 8*n)
+    for k,val in big.items():
+        values[k] = val
+    return values, pos
+
+def pack_memory(src):
+    """Bytes of a memory: runs of consecutive int64 pages, then the big values
+
+    Pages that are all zero are left out, so sparse memory stays small.
+    """
+    page_bits = PagedMemory.page_bits
+    marker = PagedMemory.big_marker
+    if isinstance(src, PagedMemory):
+        pages = src.pages
+        big = src.big
+    else:
+        pages = {}
+        big = {}
+        get = src.get
+        for index in {addr >> page_bits for addr in src}:
+            start = index << page_bits
+            cells = [get(addr, 0) for addr in range(start, start + (1 << page_bits))]
+            try:
+                page = array('q', cells)
+                overflow = marker in page
+            except OverflowError:
+                overflow = True
+            if overflow:
+                page = array('q', [val if marker < val < -marker else marker for val in cells])
+                big.update((start + offset, val) for offset,val in enumerate(cells)
+                           if not marker < val < -marker)
+            pages[index] = page
+
+    runs = []  # lists of consecutive page indices
+    for index in sorted(index for index,page in pages.items() if any(page)):
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    parts = [struct.pack('<q', len(runs))]
+    for run in runs:
+        parts.append(struct.pack('<qq', run[0], len(run)))
+        parts.extend(int64_bytes(pages[index]) for index in run)
+    parts.append(pack_big(big))
+    return b''.join(parts)
+
+def unpack_memory(buf, pos, src):
+    """Inverse of pack_memory into the empty memory src, return the position after it"""
+    page_bits = PagedMemory.page_bits
+    page_bytes = 8 << page_bits
+    n_runs, = struct.unpack_from('<q', buf, pos)
+    pos += 8
+    runs = []
+    for _ in range(n_runs):
+        start, n_pages = struct.unpack_from('<qq', buf, pos)
+        runs.append((start, buf[pos + 16:pos + 16 + n_pages*page_bytes]))
+        pos += 16 + n_pages*page_bytes
+    big, pos = unpack_big(buf, pos)
+
+    if isinstance(src, PagedMemory):
+        for start,data in runs:
+            for k in range(len(data) // page_bytes):
+                src.pages[start + k] = int64_array(data[k*page_bytes:(k + 1)*page_bytes])
+                src.owned.add(start + k)
+        src.big.update(big)
+    else:
+        for start,data in runs:
+            addr = start << page_bits
+            src.update(zip(count(addr), int64_array(data)))
+        src.update(big)
+    return pos
+
+# compiled basic blocks shared by all machines: (entry ip, code cells) -> (function, ops)
+compiled_blocks = {}
+
+class Status(Enum):
+    """Reasons for Intcode.run to return"""
+    NEED_INPUT = 'need input'  # next instruction is an input but there are no inputs
+    OUTPUT = 'output'  # an output was just produced
+    HALTED = 'halted'  # the program just exited
+    BUDGET = 'budget'  # max_steps instructions were executed
+    BREAKPOINT = 'breakpoint'  # the next instruction is at a breakpoint
+    WATCHPOINT = 'watchpoint'  # a watched memory cell was just written
+    DEADLOCK = 'deadlock'  # machines of a Pipeline are blocked on each other
+
+class Trap(Exception):
+    """Raised by handlers to stop run() at a breakpoint or watchpoint, see Intcode.trap"""
 
 class Intcode:
+    __slots__ = ('src', 'ip', 'base', 'pipe', 'inputs', 'outputs', 'last_op',
+                 'decoded', 'code', 'compiled', 'blocks', 'steps', 'profile',
+                 'text_pos', 'journal', 'fuse', 'fused', 'breakpoints', 'watchpoints', 'trap',
+                 'ready', 'tracer', 'accelerate', 'loops', 'shared')
     ops = {1: operator.add,
            2: operator.mul,
            3: 'in',
@@ -14,9 +316,35 @@ class Intcode:
            9: 'rebase',
            99: None,  # signal exit
            }
+    # number of input and output parameters for each opcode
+    arities = {1: (2, 1),
+               2: (2, 1),
+               3: (0, 1),
+               4: (1, 0),
+               5: (2, 0),
+               6: (2, 0),
+               7: (2, 1),
+               8: (2, 1),
+               9: (1, 0),
+               99: (0, 0),
+               }
+
+    # python expressions for the binary operations of compiled blocks
+    binop_templates = {1: '{} + {}',
+                       2: '{} * {}',
+                       7: '1 if {} < {} else 0',
+                       8: '1 if {} == {} else 0',
+                       }
+    max_block_length = 64  # instructions per compiled block
 
-    def __init__(self, src, inputs=None):
-        self.src = defaultdict(int)
+    def __init__(self, src, inputs=None, memory=None, compiled=False, outputs=None, fuse=True,
+                 accelerate=False):
+        # memory is an optional factory for an empty memory (e.g. PagedMemory)
+        # compiled makes run() execute straight-line code as compiled python blocks
+        # outputs is an optional OutputChannel to use instead of a list
+        # fuse makes run() execute common instruction pairs as one (see fuse_at)
+        # accelerate makes runs skip counted loops in one go (see CountedLoop)
+        self.src = memory() if memory else defaultdict(int)
         self.src.update(enumerate(src))
         self.ip = 0
         self.base = 0
@@ -24,8 +352,26 @@ class Intcode:
         if not inputs:
             inputs = deque([])
         self.inputs = deque(inputs)
-        self.outputs = []
+        self.outputs = [] if outputs is None else outputs
         self.last_op = None
+        self.steps = 0  # number of instructions executed
+        self.decoded = {}  # ip -> decoded instruction record
+        self.code = set()  # memory addresses covered by decoded instructions
+        self.compiled = compiled
+        self.blocks = {}  # entry ip -> compiled block or None if it has to be interpreted
+        self.profile = None  # Profile while profiling is enabled
+        self.text_pos = 0  # number of outputs already returned as text
+        self.journal = None  # Journal while journaling is enabled
+        self.tracer = None  # Tracer while tracing is enabled
+        self.fuse = fuse
+        self.fused = {}  # ip -> decoded or fused instruction record for run()
+        self.accelerate = accelerate
+        self.loops = {}  # start ip -> CountedLoop, for accelerated runs
+        self.breakpoints = {}  # ip -> callback or None
+        self.watchpoints = {}  # address -> callback or None
+        self.trap = None  # (status, ip or address) of the last breakpoint or watchpoint stop
+        self.ready = None  # snapshot restored by reset(), see prepare
+        self.shared = False  # whether the caches above may be shared with forks, see own_caches
 
     def export_state(self):
         return self.src.copy(), self.ip, self.base, self.inputs.copy(), self.outputs.copy(), self.last_op
@@ -33,8 +379,335 @@ class Intcode:
     def import_state(self, state):
         src, self.ip, self.base, inputs, outputs, self.last_op = state
         self.src = src.copy()
+        self.clear_caches()
         self.inputs = inputs.copy()
         self.outputs = outputs.copy()
+        self.text_pos = len(outputs)
+
+    def to_bytes(self):
+        """Serialize the state of the machine (not its options or caches)
+
+        The format is versioned: a header with ip, base, the steps counter,
+        the text position and the last opcode, then memory as int64 pages
+        (see pack_memory), then inputs and outputs. Outputs have to be a list.
+        """
+        assert isinstance(self.outputs, list), 'Only list outputs can be serialized!'
+        if self.last_op is None:
+            last_opcode = 99  # also fine for a fresh machine, there's no difference
+        else:
+            last_opcode = next(opcode for opcode,op in self.ops.items() if op is self.last_op)
+        header = state_header.pack(state_magic, state_version, self.ip, self.base,
+                                   self.steps, self.text_pos, last_opcode)
+        return header + pack_memory(self.src) + pack_ints(self.inputs) + pack_ints(self.outputs)
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        """Create a machine from the output of to_bytes, kwargs are passed to the constructor"""
+        buf = memoryview(data)
+        magic, version, ip, base, steps, text_pos, last_opcode = state_header.unpack_from(buf)
+        assert magic == state_magic, 'Not a serialized intcode machine!'
+        assert version == state_version, f'Unsupported state version {version}!'
+        comp = cls([], **kwargs)
+        comp.ip = ip
+        comp.base = base
+        comp.steps = steps
+        comp.text_pos = text_pos
+        comp.last_op = cls.ops[last_opcode]
+        pos = unpack_memory(buf, state_header.size, comp.src)
+        inputs, pos = unpack_ints(buf, pos)
+        comp.inputs.extend(inputs)
+        comp.outputs, pos = unpack_ints(buf, pos)
+        return comp
+
+    def fork(self):
+        """Return an independent copy of the machine in its current state
+
+        Unlike export_state and import_state this only copies memory once,
+        and with PagedMemory the copy is copy-on-write: the two machines
+        share pages until either of them writes to one. Decoded instructions,
+        compiled blocks, breakpoints and watchpoints are shared the same way
+        (see own_caches), so forking doesn't depend on the size of the program.
+
+        The copy has the class of the machine without its modes: profiling,
+        journaling and tracing aren't carried over. Subclasses with slots
+        of their own extend fork to set them.
+        """
+        cls = without_mode(type(self))
+        child = cls.__new__(cls)
+        child.src = self.src.copy()
+        child.ip = self.ip
+        child.base = self.base
+        child.pipe = self.pipe
+        child.inputs = self.inputs.copy()
+        child.outputs = self.outputs.copy()
+        child.last_op = self.last_op
+        child.steps = self.steps
+        # decoded code is valid for both until one of them writes into it
+        child.decoded = self.decoded
+        child.code = self.code
+        child.compiled = self.compiled
+        child.blocks = self.blocks
+        child.profile = None
+        child.text_pos = self.text_pos
+        child.journal = None
+        child.tracer = None
+        child.fuse = self.fuse
+        child.fused = self.fused
+        child.accelerate = self.accelerate
+        child.loops = self.loops
+        child.breakpoints = self.breakpoints
+        child.watchpoints = self.watchpoints
+        child.trap = self.trap
+        child.ready = self.ready  # never run, safe to share
+        child.shared = True
+        if cls.handlers is type(self).handlers:
+            self.shared = True
+        else:
+            # decoded instructions hold the handlers of a mode (e.g. journaling)
+            child.clear_caches()
+        return child
+
+    @classmethod
+    def prepare(cls, src, **kwargs):
+        """Create a machine that can be reset() to its state at the first input
+
+        The program runs once until it asks for input (or halts), and that
+        state is kept as a snapshot. kwargs are passed to the constructor.
+        """
+        comp = cls(src, **kwargs)
+        comp.run(until={'input', 'halt'})
+        comp.ready = comp.fork()
+        return comp
+
+    def reset(self):
+        """Restore the state the machine was prepared in, dropping pending inputs
+
+        Decoded instructions and compiled blocks are kept, unless the run
+        since the snapshot changed memory under them, so repeated short runs
+        don't decode and compile the same code every time.
+        """
+        ready = self.ready
+        assert ready, 'The machine was not created by prepare!'
+        assert not self.journal, 'Use rewind_to(0) on journaled machines!'
+        code = self.code
+        if code:
+            cells = operator.itemgetter(*code)
+            if cells(self.src) != cells(ready.src):
+                self.clear_caches()
+        self.src = ready.src.copy()
+        self.ip = ready.ip
+        self.base = ready.base
+        self.inputs.clear()
+        self.outputs = ready.outputs.copy()
+        self.last_op = ready.last_op
+        self.steps = ready.steps
+        self.text_pos = ready.text_pos
+        self.trap = None
+
+    def enable_profiling(self, bucket_size=64):
+        """Start collecting execution statistics, return the Profile
+
+        The machine's class is swapped for a subclass with instrumented
+        step() and run() methods, so machines that aren't profiled don't
+        pay for it at all. Profiled runs are always interpreted.
+        """
+        assert not self.tracer, 'Profiling and tracing can\'t be combined!'
+        self.profile = Profile(bucket_size)
+        self.add_mode(ProfiledMixin)
+        return self.profile
+
+    def disable_profiling(self):
+        """Stop profiling, return the collected Profile"""
+        profile = self.profile
+        self.remove_mode(ProfiledMixin)
+        self.profile = None
+        return profile
+
+    def add_mode(self, mixin):
+        """Swap the class of the machine for a subclass with mixin on top, see with_mode
+
+        Modes stack: e.g. a journaled machine can be profiled as well.
+        """
+        cls = type(self)
+        if not issubclass(cls, mixin):
+            self.swap_class(with_mode(cls, mixin))
+
+    def remove_mode(self, mixin):
+        """Swap the class of the machine for one without mixin, keeping other modes"""
+        self.swap_class(without_mode(type(self), mixin))
+
+    def swap_class(self, cls):
+        # decoded instructions hold the handlers of the old class
+        if cls.handlers is not type(self).handlers:
+            self.clear_caches()
+        self.__class__ = cls
+
+    def own_caches(self, keep=True):
+        """Stop sharing caches with forks before changing them, copying them if keep
+
+        Forks share decoded instructions, compiled blocks, counted loops,
+        breakpoints and watchpoints, and whoever changes them first (even
+        only to add to them) gets copies of its own, like PagedMemory pages.
+        That's why run loops look the caches up on self.
+        """
+        if keep:
+            self.decoded = self.decoded.copy()
+            self.code = self.code.copy()
+            self.blocks = self.blocks.copy()
+            self.fused = self.fused.copy()
+            self.loops = self.loops.copy()
+        else:
+            self.decoded = {}
+            self.code = set()
+            self.blocks = {}
+            self.fused = {}
+            self.loops = {}
+        self.breakpoints = self.breakpoints.copy()
+        self.watchpoints = self.watchpoints.copy()
+        self.shared = False
+
+    def clear_caches(self):
+        """Forget decoded instructions and compiled blocks"""
+        if self.shared:
+            self.own_caches(keep=False)
+        self.decoded.clear()
+        self.code.clear()
+        self.blocks.clear()
+        self.fused.clear()
+        self.loops.clear()
+        # watched cells are in code so that writes to them go through invalidate
+        self.code.update(self.watchpoints)
+
+    def add_breakpoint(self, ip, callback=None):
+        """Make run() stop right before the instruction at ip
+
+        If a callback is given, it's called with the machine when the
+        breakpoint is hit, and run() only stops if it returns True.
+        Running again from a breakpoint stop executes the instruction.
+        Breakpoints are built into the decoded instructions, so they don't
+        cost anything elsewhere.
+        """
+        self.clear_caches()
+        self.breakpoints[ip] = callback
+
+    def remove_breakpoint(self, ip):
+        self.clear_caches()
+        del self.breakpoints[ip]
+
+    def add_watchpoint(self, addr, callback=None):
+        """Make run() stop right after the memory cell at addr is written
+
+        If a callback is given, it's called with the machine and the address
+        after every write, and run() only stops if it returns True. Watched
+        cells are treated like code cells, whose writes are checked anyway.
+        """
+        if self.shared:
+            self.own_caches()
+        self.watchpoints[addr] = callback
+        self.code.add(addr)
+
+    def remove_watchpoint(self, addr):
+        if self.shared:
+            self.own_caches(keep=False)
+        del self.watchpoints[addr]
+        self.clear_caches()
+
+    def enable_journal(self, every=64):
+        """Start logging consumed inputs with a snapshot every `every` inputs, return the Journal
+
+        The first snapshot is the current state. Like enable_profiling this
+        swaps the class of the machine, here for one with a logging input
+        instruction.
+        """
+        self.journal = Journal(self.fork(), every)
+        self.add_mode(JournaledMixin)
+        return self.journal
+
+    def disable_journal(self):
+        """Stop journaling, return the Journal"""
+        journal = self.journal
+        self.remove_mode(JournaledMixin)
+        self.journal = None
+        return journal
+
+    def enable_tracing(self, path, buffer_records=65536):
+        """Start writing every executed instruction to a binary file at path, return the Tracer
+
+        Like enable_profiling this swaps the class of the machine, here for
+        one with a recording step() and run(). Traced runs are always
+        interpreted. The file is complete once tracing is disabled. See
+        intcode_trace for reading and analyzing traces.
+        """
+        assert not self.profile, 'Profiling and tracing can\'t be combined!'
+        if self.tracer:
+            self.tracer.close()
+        self.tracer = Tracer(path, buffer_records)
+        self.add_mode(TracedMixin)
+        return self.tracer
+
+    def disable_tracing(self):
+        """Stop tracing, close the trace file and return the Tracer"""
+        tracer = self.tracer
+        self.remove_mode(TracedMixin)
+        if tracer:
+            tracer.close()
+        self.tracer = None
+        return tracer
+
+    def rewind_to(self, input_index):
+        """Restore the state from right before input number input_index was consumed
+
+        The nearest earlier snapshot of the journal is restored, and the
+        logged inputs from there on are replayed, so this runs at most
+        `every` inputs worth of instructions. Pending inputs are dropped,
+        and the journal forgets everything after input_index. Outputs
+        are replayed too, so callbacks of output channels see them again.
+        The steps counter isn't rewound.
+        """
+        journal = self.journal
+        assert journal, 'Journaling is not enabled!'
+        assert 0 <= input_index <= len(journal.inputs), f'Invalid input index {input_index}!'
+        snapshots = journal.snapshots
+        while snapshots[-1][0] > input_index:
+            snapshots.pop()
+        index, snapshot = snapshots[-1]
+        tail = journal.inputs[index:input_index]
+        del journal.inputs[index:]
+
+        self.src = snapshot.src.copy()
+        self.ip = snapshot.ip
+        self.base = snapshot.base
+        self.inputs = deque(tail)
+        self.outputs = snapshot.outputs.copy()
+        self.last_op = snapshot.last_op
+        self.text_pos = snapshot.text_pos
+        # breakpoints may have changed since the snapshot, decode again
+        self.clear_caches()
+        while self.inputs:
+            if self.run(until={'input', 'halt'}) is Status.HALTED:
+                break
+
+    def send_line(self, line):
+        """Queue a line of ASCII text (or several) as input, adding the newline"""
+        self.inputs.extend(line.encode('ascii'))
+        self.inputs.append(10)
+
+    def read_until_prompt(self):
+        """Run until the program asks for input or halts, return the new output as text
+
+        Only outputs produced since the last read are decoded. Values that
+        aren't ASCII (e.g. a final answer) are left out of the text, they
+        can still be found in outputs.
+        """
+        self.run(until={'input', 'halt'})
+        outputs = self.outputs
+        new = outputs[self.text_pos:]
+        self.text_pos = len(outputs)
+        return bytes(val for val in new if 0 <= val < 128).decode('ascii')
+
+    def read_lines(self):
+        """Version of read_until_prompt that returns a list of lines"""
+        return self.read_until_prompt().splitlines()
 
     def pipe_into(self, other):
         self.pipe = other
@@ -50,97 +723,1060 @@ class Intcode:
         """Peek at the next input instruction"""
         return self.ops[self.src[self.ip] % 100]
 
-    def step(self):
-        """Take a step in the intcode program"""
+    def decode(self, ip):
+        """Decode the instruction at ip and cache the result
+
+        The record is a tuple (handler, op, params, next_ip) where params
+        holds an (address, relative) pair for each parameter: the value of
+        the parameter lives at src[address + relative*base]. Since parameter
+        values are resolved here, the record has to be dropped whenever its
+        own memory cells are overwritten (see invalidate).
+        """
         src = self.src
-        ip = self.ip
-    
         opval = src[ip]
-    
         opcode = opval % 100
-        if opcode == 99:
-            n_inps = 0
-            n_outs = 0
-        elif opcode in [1, 2]:
-            n_inps = 2
-            n_outs = 1
-        elif opcode == 3:
-            n_inps = 0
-            n_outs = 1
-        elif opcode == 4:
-            n_inps = 1
-            n_outs = 0
-        elif opcode in [5, 6]:
-            n_inps = 2
-            n_outs = 0
-        elif opcode in [7, 8]:
-            n_inps = 2
-            n_outs = 1
-        elif opcode == 9:
-            n_inps = 1
-            n_outs = 0
-        else:
-            assert False, f'Invalid opcode {opcode} at position {i}!'
-    
-        op = self.ops.get(opcode, -1)
-        assert op != -1, f'Need to implement more operations in ops dict!'
+        assert opcode in self.arities, f'Invalid opcode {opcode} at position {ip}!'
+        n_inps, n_outs = self.arities[opcode]
 
-        self.last_op = op
-    
         parammodes = self.modes_from_op(opval)
         params = []
-        for k,mode in zip(range(ip + 1, ip + 1 + n_inps), parammodes):
+        for k,mode in zip(range(ip + 1, ip + 1 + n_inps + n_outs), parammodes):
             if mode == 0:
-                index = src[k]
+                param = (src[k], 0)
             elif mode == 1:
-                index = k
+                assert k < ip + 1 + n_inps, 'What does output_mode == 1 mean?'
+                param = (k, 0)
             elif mode == 2:
-                index = self.base + src[k]
+                param = (src[k], 1)
             else:
                 assert False, f'Invalid parameter mode {mode}!'
-            assert index >= 0, f'Invalid input index {index}!'
-
-            param = src[index]
+            # negative addresses are checked by the handlers, when they're used
             params.append(param)
 
-        if n_outs:
-            output_mode = next(parammodes)
-            if output_mode == 0:
-                ip_out = src[ip + 1 + n_inps]
-            elif output_mode == 2:
-                ip_out = self.base + src[ip + 1 + n_inps]
+        next_ip = ip + 1 + n_inps + n_outs
+        handler = type(self).do_break if ip in self.breakpoints else self.handlers[opcode]
+        instr = handler, self.ops[opcode], tuple(params), next_ip
+        if self.shared:
+            self.own_caches()
+        self.decoded[ip] = instr
+        self.code.update(range(ip, next_ip))
+        return instr
+
+    def invalidate(self, addr):
+        """Drop decoded instructions overlapping a freshly written address"""
+        if self.shared:
+            self.own_caches()
+        # instructions are at most 4 cells long
+        for ip in range(addr - 3, addr + 1):
+            instr = self.decoded.get(ip)
+            if instr and instr[3] > addr:
+                del self.decoded[ip]
+                self.code.difference_update(range(ip, instr[3]))
+
+        # fused pairs are at most 7 cells long
+        fused = self.fused
+        for ip in range(addr - 6, addr + 1):
+            instr = fused.get(ip)
+            if instr and instr[3] > addr:
+                del fused[ip]
+        # counted loops can be longer
+        if self.loops:
+            for ip,loop in list(self.loops.items()):
+                if ip <= addr < loop.end:
+                    del self.loops[ip]
+                    fused.pop(ip, None)
+
+        # self-modified blocks are interpreted from now on
+        for ip,block in self.blocks.items():
+            if block and ip <= addr < block[2]:
+                self.blocks[ip] = None
+
+        watchpoints = self.watchpoints
+        if watchpoints:
+            self.code.update(watchpoints)
+            if addr in watchpoints:
+                callback = watchpoints[addr]
+                if callback is None or callback(self, addr):
+                    self.trap = Status.WATCHPOINT, addr
+                    raise Trap
+
+    def fuse_at(self, ip):
+        """Decode the instruction at ip for run(), fusing common idioms
+
+        The record has the same shape as the ones of decode, and it's stored
+        in self.fused. Idioms are
+            - moves (add x, #0 -> y or mul x, #1 -> y), with a cheaper handler
+            - compare followed by a conditional jump
+            - rebase followed by an arithmetic instruction or a jump
+        a fused pair runs with one dispatch. Fused handlers count their
+        second instruction in self.steps themselves, and run() only uses
+        them when there's no max_steps budget.
+
+        With accelerate, an instruction starting a counted loop (see
+        CountedLoop) gets a record that runs the whole loop at once.
+        """
+        if self.shared:
+            self.own_caches()
+        instr = self.decoded.get(ip) or self.decode(ip)
+        opcode = self.src[ip] % 100
+        handler, op, params, next_ip = instr
+        if ip in self.breakpoints:
+            self.fused[ip] = instr
+            return instr
+        second = None
+        if opcode in (7, 8, 9) and next_ip not in self.breakpoints:
+            try:
+                second = self.decoded.get(next_ip) or self.decode(next_ip)
+            except AssertionError:
+                # not valid code (yet), leave it to the interpreter
+                pass
+
+        if opcode in (1, 2):
+            # a move has an immediate 0 (add) or 1 (mul) input
+            unit = 0 if opcode == 1 else 1
+            for k,(addr,rel) in enumerate(params[:2]):
+                if not rel and addr == ip + 1 + k and self.src[addr] == unit:
+                    (a, ra), (out, rout) = params[1 - k], params[2]
+                    instr = type(self).do_move, op, (a, ra, out, rout), next_ip
+                    break
+        elif second and opcode in (7, 8) and second[1] in ('jmpif', 'jmpifn'):
+            (a, ra), (b, rb), (out, rout) = params
+            (c, rc), (t, rt) = second[2]
+            instr = (type(self).do_cmp_jump, second[1],
+                     (op, opcode == 7, a, ra, b, rb, out, rout, next_ip, c, rc, t, rt, second[1] == 'jmpif'),
+                     second[3])
+        elif second and opcode == 9 and second[1] not in ('in', 'out', 'rebase', None):
+            (a, ra), = params
+            instr = type(self).do_rebase_and, second[1], (a, ra, second), second[3]
+
+        if self.accelerate and opcode in (1, 2, 7, 8):
+            loop = CountedLoop.find(self, ip)
+            if loop:
+                loop.fallback = instr
+                self.loops[ip] = loop
+                instr = type(self).do_loop, loop.jump_op, loop, loop.end
+
+        self.fused[ip] = instr
+        return instr
+
+    def compile_block(self, ip):
+        """Compile the straight-line code starting at ip into a python function
+
+        The block runs arithmetic and rebase instructions up to and including
+        the next jump, and stops before any input, output or exit. The function
+        is called as fun(src, base, code) and returns (ip, base, n, dirty)
+        where n is the number of instructions executed and dirty is a written
+        address that's part of decoded code (in which case the block returns
+        right after that write), or None.
+
+        Returns a (function, ops, end) tuple, or None if there's nothing to
+        compile at ip. The block is also stored in self.blocks. With
+        accelerate, a counted loop starting at ip is stored in self.loops.
+        """
+        if self.shared:
+            self.own_caches()
+        src = self.src
+        if self.accelerate and src[ip] % 100 in (1, 2, 7, 8) and ip not in self.loops:
+            loop = CountedLoop.find(self, ip)
+            if loop:
+                self.loops[ip] = loop
+        instrs = []
+        pos = ip
+        while (len(instrs) < self.max_block_length and src[pos] % 100 in self.arities
+               and pos not in self.breakpoints):
+            instr = self.decoded.get(pos) or self.decode(pos)
+            if instr[1] in ('in', 'out', None):
+                break
+            instrs.append((pos, instr))
+            pos = instr[3]
+            if instr[1] in ('jmpif', 'jmpifn'):
+                break
+        if not instrs:
+            self.blocks[ip] = None
+            return None
+
+        key = ip, tuple(src[k] for k in range(ip, pos))
+        if key not in compiled_blocks:
+            compiled_blocks[key] = self.generate_block(instrs)
+        fun, ops = compiled_blocks[key]
+        block = self.blocks[ip] = fun, ops, pos
+        return block
+
+    def generate_block(self, instrs):
+        """Generate and exec the python source of a block of decoded instructions"""
+        src = self.src
+
+        def param(pos, k, addr, rel):
+            if rel:
+                return f'src[base + {addr}]'
+            if addr == pos + 1 + k:
+                # immediate value, invalidated along with the code if it changes
+                return str(src[addr])
+            return f'src[{addr}]'
+
+        body = ['def block(src, base, code):']
+        ops = []
+        for n,(pos,instr) in enumerate(instrs, start=1):
+            _, op, params, next_ip = instr
+            ops.append(op)
+            values = [param(pos, k, *p) for k,p in enumerate(params)]
+            opcode = src[pos] % 100
+            for k,(addr,rel) in enumerate(params):
+                if rel or addr < 0:
+                    kind = 'output' if k == 2 else 'input'
+                    index = f'base + {addr}' if rel else str(addr)
+                    body.append(f"assert {index} >= 0, f'Invalid {kind} index {{{index}}}!'")
+            if opcode in self.binop_templates:
+                expr = self.binop_templates[opcode].format(*values[:2])
+                out, rout = params[2]
+                body.append(f'addr = base + {out}' if rout else f'addr = {out}')
+                body.append(f'src[addr] = {expr}')
+                body.append(f'if addr in code: return {next_ip}, base, {n}, addr')
+            elif op == 'rebase':
+                body.append(f'base += {values[0]}')
+            elif op == 'jmpif':
+                body.append(f'return ({values[1]} if {values[0]} else {next_ip}), base, {n}, None')
+            elif op == 'jmpifn':
+                body.append(f'return ({next_ip} if {values[0]} else {values[1]}), base, {n}, None')
+        if ops[-1] not in ('jmpif', 'jmpifn'):
+            body.append(f'return {instrs[-1][1][3]}, base, {len(instrs)}, None')
+
+        namespace = {}
+        exec('\n    '.join(body), namespace)
+        return namespace['block'], ops
+
+    def step(self):
+        """Take a step in the intcode program
+
+        Returns None, or a Status if a breakpoint or watchpoint was hit.
+        """
+        instr = self.decoded.get(self.ip) or self.decode(self.ip)
+        self.last_op = instr[1]
+        self.steps += 1
+        try:
+            instr[0](self, instr)
+        except Trap:
+            if self.trap[0] is Status.BREAKPOINT:
+                self.steps -= 1
+            return self.trap[0]
+
+    def run(self, until=('input', 'output', 'halt'), max_steps=None):
+        """Run the program until something interesting happens
+
+        Input:
+            until: events to stop at, any of 'input', 'output', 'halt'
+        max_steps: optional number of instructions to execute at most
+
+        Returns a Status. Running out of inputs and halting always stop the
+        run (there's nothing else to do), so in practice `until` decides
+        whether to return after every output. When inputs run out the
+        input instruction is not executed, so run can simply be called
+        again after adding inputs.
+
+        Breakpoints and watchpoints (see add_breakpoint and add_watchpoint)
+        also stop the run, with self.trap telling which one it was.
+        """
+        assert set(until) <= {'input', 'output', 'halt'}, f'Invalid stop events {until}!'
+        if self.compiled:
+            return self.run_compiled(until, max_steps)
+        stop_on_output = 'output' in until
+        fuse = self.fuse and max_steps is None
+        decode = self.fuse_at if fuse else self.decode
+        inputs = self.inputs
+        n = 0  # number of the instruction (or fused pair) being executed
+        try:
+            for n in (count(1) if max_steps is None else range(1, max_steps + 1)):
+                instr = (self.fused if fuse else self.decoded).get(self.ip) or decode(self.ip)
+                op = instr[1]
+                if op == 'in' and not inputs:
+                    self.steps += n - 1
+                    return Status.NEED_INPUT
+                self.last_op = op
+                instr[0](self, instr)
+                if op is None:
+                    self.steps += n
+                    return Status.HALTED
+                if op == 'out' and stop_on_output:
+                    self.steps += n
+                    return Status.OUTPUT
+        except Trap:
+            status = self.trap[0]
+            # the instruction at a breakpoint didn't run, a watched write did
+            self.steps += n - 1 if status is Status.BREAKPOINT else n
+            return status
+        self.steps += n
+        return Status.BUDGET
+
+    def run_compiled(self, until, max_steps):
+        """Version of run() that executes compiled blocks where possible"""
+        stop_on_output = 'output' in until
+        inputs = self.inputs
+        budget = max_steps
+        try:
+            while budget is None or budget > 0:
+                ip = self.ip
+                loops = self.loops
+                if loops and budget is None and ip in loops and loops[ip].run(self):
+                    self.last_op = loops[ip].jump_op
+                    self.steps += 1
+                    continue
+                blocks = self.blocks
+                block = blocks[ip] if ip in blocks else self.compile_block(ip)
+                if block and (budget is None or len(block[1]) <= budget):
+                    fun, ops, _ = block
+                    self.ip, self.base, n, dirty = fun(self.src, self.base, self.code)
+                    self.last_op = ops[n - 1]
+                    self.steps += n
+                    if dirty is not None:
+                        self.invalidate(dirty)
+                    if budget is not None:
+                        budget -= n
+                    continue
+
+                # interpret a single instruction
+                instr = self.decoded.get(ip) or self.decode(ip)
+                op = instr[1]
+                if op == 'in' and not inputs:
+                    return Status.NEED_INPUT
+                self.last_op = op
+                self.steps += 1
+                instr[0](self, instr)
+                if budget is not None:
+                    budget -= 1
+                if op is None:
+                    return Status.HALTED
+                if op == 'out' and stop_on_output:
+                    return Status.OUTPUT
+        except Trap:
+            # breakpoints are never inside blocks, so they stop an interpreted instruction
+            if self.trap[0] is Status.BREAKPOINT:
+                self.steps -= 1
+            return self.trap[0]
+        return Status.BUDGET
+
+    def do_binop(self, instr):
+        """Handle add, mul, less-than and equals"""
+        _, op, ((a, ra), (b, rb), (out, rout)), next_ip = instr
+        src = self.src
+        base = self.base
+        a += ra*base
+        b += rb*base
+        out += rout*base
+        assert a >= 0 and b >= 0, f'Invalid input index {min(a, b)}!'
+        assert out >= 0, f'Invalid output index {out}!'
+        src[out] = op(src[a], src[b])
+        self.ip = next_ip
+        if out in self.code:
+            self.invalidate(out)
+
+    def do_in(self, instr):
+        _, _, ((out, rout),), next_ip = instr
+        out += rout*self.base
+        assert out >= 0, f'Invalid output index {out}!'
+        self.src[out] = self.inputs.popleft()
+        self.ip = next_ip
+        if out in self.code:
+            self.invalidate(out)
+
+    def do_out(self, instr):
+        _, _, ((a, ra),), next_ip = instr
+        a += ra*self.base
+        assert a >= 0, f'Invalid input index {a}!'
+        self.ip = next_ip
+        res = self.src[a]
+        self.outputs.append(res)
+        if self.pipe:
+            self.pipe.inputs.append(res)
+
+    def do_jmpif(self, instr):
+        _, _, ((a, ra), (b, rb)), next_ip = instr
+        src = self.src
+        base = self.base
+        a += ra*base
+        b += rb*base
+        assert a >= 0 and b >= 0, f'Invalid input index {min(a, b)}!'
+        self.ip = src[b] if src[a] else next_ip
+
+    def do_jmpifn(self, instr):
+        _, _, ((a, ra), (b, rb)), next_ip = instr
+        src = self.src
+        base = self.base
+        a += ra*base
+        b += rb*base
+        assert a >= 0 and b >= 0, f'Invalid input index {min(a, b)}!'
+        self.ip = next_ip if src[a] else src[b]
+
+    def do_rebase(self, instr):
+        _, _, ((a, ra),), next_ip = instr
+        a += ra*self.base
+        assert a >= 0, f'Invalid input index {a}!'
+        self.base += self.src[a]
+        self.ip = next_ip
+
+    def do_halt(self, instr):
+        self.ip = instr[3]
+
+    def do_break(self, instr):
+        """Handler of instructions at breakpoints, wraps the real handler"""
+        ip = self.ip
+        if self.trap != (Status.BREAKPOINT, ip):
+            callback = self.breakpoints[ip]
+            if callback is None or callback(self):
+                self.trap = Status.BREAKPOINT, ip
+                raise Trap
+        self.trap = None
+        self.handlers[self.src[ip] % 100](self, instr)
+
+    # handlers of fused records, see fuse_at
+
+    def do_move(self, instr):
+        _, _, (a, ra, out, rout), next_ip = instr
+        src = self.src
+        base = self.base
+        a += ra*base
+        out += rout*base
+        assert a >= 0, f'Invalid input index {a}!'
+        assert out >= 0, f'Invalid output index {out}!'
+        src[out] = src[a]
+        self.ip = next_ip
+        if out in self.code:
+            self.invalidate(out)
+
+    def do_cmp_jump(self, instr):
+        _, _, (op, less, a, ra, b, rb, out, rout, jump_ip, c, rc, t, rt, if_true), next_ip = instr
+        src = self.src
+        base = self.base
+        a += ra*base
+        b += rb*base
+        out += rout*base
+        assert a >= 0 and b >= 0, f'Invalid input index {min(a, b)}!'
+        assert out >= 0, f'Invalid output index {out}!'
+        if less:
+            src[out] = 1 if src[a] < src[b] else 0
+        else:
+            src[out] = 1 if src[a] == src[b] else 0
+        if out in self.code:
+            # the code may have changed, stop before the jump
+            self.last_op = op
+            self.ip = jump_ip
+            self.invalidate(out)
+            return
+        self.steps += 1
+        c += rc*base
+        t += rt*base
+        assert c >= 0 and t >= 0, f'Invalid input index {min(c, t)}!'
+        if (src[c] != 0) == if_true:
+            self.ip = src[t]
+        else:
+            self.ip = next_ip
+
+    def do_rebase_and(self, instr):
+        _, _, (a, ra, second), _ = instr
+        a += ra*self.base
+        assert a >= 0, f'Invalid input index {a}!'
+        self.base += self.src[a]
+        self.steps += 1
+        second[0](self, second)
+
+    def do_loop(self, instr):
+        loop = instr[2]
+        if not loop.run(self):
+            # run a single instruction (or fused pair) instead
+            fallback = loop.fallback
+            self.last_op = fallback[1]
+            fallback[0](self, fallback)
+
+    handlers = {1: do_binop,
+                2: do_binop,
+                3: do_in,
+                4: do_out,
+                5: do_jmpif,
+                6: do_jmpifn,
+                7: do_binop,
+                8: do_binop,
+                9: do_rebase,
+                99: do_halt,
+                }
+
+class CountedLoop:
+    """Straight-line loop of arithmetic instructions ending in a jump back to its start
+
+    Such a loop is run in closed form when it's an induction loop: every
+    cell written in the body is either
+        - an induction variable, x = x + constant
+        - an accumulator, x = x + linear function of induction variables
+        - a temporary, x = linear function of induction variables
+        - a comparison of linear functions of induction variables
+    and the jump condition is a comparison, or a linear function of
+    induction variables. Cells that aren't written are constants. The
+    number of iterations then follows from the initial values, and so do
+    the final values of all written cells; steps and last_op end up the
+    same as if the loop ran normally.
+
+    The analysis depends on the base and on the values of the constant
+    cells, so it's done when the loop is entered and cached. Loops that
+    don't fit, would run forever, or write into code or watched cells are
+    left to the fallback record (the normal one for the first instruction).
+    """
+    max_length = 16  # instructions of the body
+    max_cached = 64  # analyses kept per loop
+
+    def __init__(self, start, body, jump, end):
+        self.start = start
+        self.body = body  # list of (opcode, params) of the arithmetic instructions
+        self.jump = jump  # (opcode, (addr, rel)) of the condition
+        self.jump_op = Intcode.ops[jump[0]]
+        self.end = end  # ip after the jump
+        self.length = len(body) + 1
+        self.fallback = None  # record run when the loop can't be accelerated
+        self.layouts = {}  # base -> (written cells, constant cells) or None
+        self.summaries = {}  # (base, values of constant cells) -> summary or None
+
+    @classmethod
+    def find(cls, comp, start):
+        """Return the loop starting at start, None if there's no loop there"""
+        body = []
+        ip = start
+        src = comp.src
+        for _ in range(cls.max_length + 1):
+            if ip in comp.breakpoints:
+                return None
+            try:
+                instr = comp.decoded.get(ip) or comp.decode(ip)
+            except AssertionError:
+                return None
+            opcode = src[ip] % 100
+            if opcode in (1, 2, 7, 8):
+                body.append((opcode, instr[2]))
+                ip = instr[3]
+                continue
+            if opcode in (5, 6) and body:
+                cond, (target, rel) = instr[2]
+                # immediate jump target, and no pointer writes into the loop itself
+                if (not rel and target == ip + 2 and src[target] == start
+                    and not any(not rout and start <= out < instr[3] for _,(*_, (out, rout)) in body)):
+                    return cls(start, body, (opcode, cond), instr[3])
+            return None
+        return None
+
+    def layout(self, base):
+        """Return (written cells, constant cells) for a base, None if the body writes into itself"""
+        if base in self.layouts:
+            return self.layouts[base]
+        written = set()
+        read = []
+        for opcode,params in self.body:
+            read.extend(addr + rel*base for addr,rel in params[:2])
+            written.add(params[2][0] + params[2][1]*base)
+        addr, rel = self.jump[1]
+        read.append(addr + rel*base)
+        layout = None
+        # negative addresses are left to the interpreter to report
+        if all(not self.start <= addr < self.end for addr in written) and min(*read, *written) >= 0:
+            constants = tuple(sorted({addr for addr in read if addr not in written}))
+            layout = frozenset(written), constants
+        self.layouts[base] = layout
+        return layout
+
+    @staticmethod
+    def linear_sum(x, y, factor=1):
+        """x + factor*y for linear functions as dicts of cell -> coefficient (None for the constant)"""
+        res = dict(x)
+        for var,coef in y.items():
+            res[var] = res.get(var, 0) + factor*coef
+        return {var: coef for var,coef in res.items() if coef or var is None}
+
+    def analyze(self, src, base, written):
+        """Symbolically run one iteration, return a summary or None if it's not an induction loop"""
+        state = {}  # cell -> linear function of the initial values, or (kind, linear function)
+        def value(addr):
+            if addr in state:
+                return state[addr]
+            if addr in written:
+                return {addr: 1, None: 0}
+            return {None: src[addr]}
+
+        linear_sum = self.linear_sum
+        for opcode,((a, ra), (b, rb), (out, rout)) in self.body:
+            x, y = value(a + ra*base), value(b + rb*base)
+            if isinstance(x, tuple) or isinstance(y, tuple):
+                return None
+            if opcode == 1:
+                res = linear_sum(x, y)
+            elif opcode == 2:
+                if len(x) == 1:
+                    x, y = y, x
+                if len(y) != 1:
+                    return None
+                res = linear_sum({None: 0}, x, y[None])
             else:
-                assert False, 'What does output_mode == 1 mean?'
+                # the comparison is true when the difference is > 0 (lt) or == 0 (eq)
+                res = ('gt' if opcode == 7 else 'eq'), linear_sum(y, x, -1)
+            state[out + rout*base] = res
 
-            assert ip_out >= 0, f'Invalid output index {ip_out}!'
+        # when to go on looping, in terms of a linear function
+        opcode, (c, rc) = self.jump
+        cond = value(c + rc*base)
+        if isinstance(cond, tuple):
+            kind, cond = cond
+            if opcode == 6:
+                kind = {'gt': 'le', 'eq': 'ne'}[kind]
         else:
-            ip_out = None
+            kind = 'ne' if opcode == 5 else 'eq'
 
-        # handle "input"
-        if op == "in":
-            src[ip_out] = self.inputs.popleft()
+        induction = {}
+        for addr,res in state.items():
+            if not isinstance(res, tuple) and res.keys() <= {addr, None} and res.get(addr) == 1:
+                induction[addr] = res[None]
 
-        # handle relative base offset
-        if op == 'rebase':
-            offset = params[0]
-            self.base += offset
+        def over_induction(res, addr=None):
+            return all(var is None or var in induction or var == addr for var in res)
 
-        # handle jumps, increment intruction pointer
-        if (op == 'jmpif' and params[0]) or (op == 'jmpifn' and not params[0]):
-            self.ip = params[1]
+        accumulators = []
+        temporaries = []
+        comparisons = []
+        for addr,res in state.items():
+            if addr in induction:
+                continue
+            if isinstance(res, tuple):
+                if not over_induction(res[1]):
+                    return None
+                comparisons.append((addr, res[0] == 'gt', res[1]))
+            elif res.get(addr, 0) == 1 and over_induction(res, addr):
+                accumulators.append((addr, {var: coef for var,coef in res.items() if var != addr}))
+            elif addr not in res and over_induction(res):
+                temporaries.append((addr, res))
+            else:
+                return None
+        if not over_induction(cond):
+            return None
+        return induction, accumulators, temporaries, comparisons, (kind, cond)
+
+    @staticmethod
+    def iterations(kind, d0, dd):
+        """Number of iterations until the condition on d0 + k*dd fails, None if it never does"""
+        if kind == 'gt':
+            if d0 <= 0:
+                return 1
+            return None if dd >= 0 else (d0 - dd - 1) // -dd + 1
+        if kind == 'le':
+            if d0 > 0:
+                return 1
+            return None if dd <= 0 else -d0 // dd + 2
+        if kind == 'eq':
+            if d0 != 0:
+                return 1
+            return None if dd == 0 else 2
+        # 'ne'
+        if d0 == 0:
+            return 1
+        if dd == 0 or d0 % dd or -d0 // dd < 0:
+            return None
+        return -d0 // dd + 1
+
+    def run(self, comp):
+        """Run the loop in closed form from its start, return False if it can't be done
+
+        One of the executed instructions is left for the caller to count,
+        as run() counts one step per record.
+        """
+        src = comp.src
+        base = comp.base
+        layout = self.layout(base)
+        if layout is None:
+            return False
+        written, constants = layout
+        if not comp.code.isdisjoint(written):
+            return False
+        key = base, tuple(src[addr] for addr in constants)
+        if key in self.summaries:
+            summary = self.summaries[key]
         else:
-            self.ip += 1 + n_inps + n_outs
-    
-        # handle "output"
-        if op == "out":
-            # value is params[0]
-            res = params[0]
-            self.outputs.append(res)
-            if self.pipe:
-                self.pipe.inputs.append(res)
-    
-        # compute values for callables
-        if callable(op):
-            src[ip_out] = op(*params)
-
-        return
+            if len(self.summaries) >= self.max_cached:
+                self.summaries.clear()
+            summary = self.summaries[key] = self.analyze(src, base, written)
+        if summary is None:
+            return False
+
+        induction, accumulators, temporaries, comparisons, (kind, cond) = summary
+        start = {addr: src[addr] for addr in induction}
+        def evaluate(res, k):
+            # value of a linear function of the induction variables in iteration k
+            return sum(coef * (start[var] + k*induction[var]) if var is not None else coef
+                       for var,coef in res.items())
+        d0 = evaluate(cond, 0)
+        n = self.iterations(kind, d0, evaluate(cond, 1) - d0)
+        if n is None or n < 2:
+            return False
+
+        last = n - 1
+        for addr,res in accumulators:
+            # sum over iterations 0..n-1 of the increment
+            total = 0
+            for var,coef in res.items():
+                if var is None:
+                    total += coef * n
+                else:
+                    total += coef * (n*start[var] + induction[var]*n*last // 2)
+            src[addr] += total
+        for addr,res in temporaries:
+            src[addr] = evaluate(res, last)
+        for addr,greater,res in comparisons:
+            d = evaluate(res, last)
+            src[addr] = int(d > 0 if greater else d == 0)
+        for addr,step in induction.items():
+            src[addr] = start[addr] + n*step
+
+        comp.steps += n*self.length - 1
+        comp.ip = self.end
+        return True
+
+class Profile:
+    """Execution statistics collected by a profiled Intcode machine
+
+    Counts executions per (ip, instruction value), from which counts per
+    opcode, per ip and per parameter mode are derived, and counts memory
+    reads and writes per block of `bucket_size` addresses.
+    """
+    opnames = {1: 'add', 2: 'mul', 3: 'in', 4: 'out', 5: 'jmpif', 6: 'jmpifn',
+               7: 'lt', 8: 'eq', 9: 'rebase', 99: 'halt'}
+
+    def __init__(self, bucket_size=64):
+        self.bucket_size = bucket_size
+        self.executions = Counter()  # (ip, opval) -> count
+        self.reads = Counter()  # address // bucket_size -> count
+        self.writes = Counter()  # address // bucket_size -> count
+        self.elapsed = 0.0  # seconds spent in profiled step() and run() calls
+
+    def record(self, comp, ip, instr):
+        """Count an instruction that's about to be executed"""
+        opval = comp.src[ip]
+        self.executions[ip, opval] += 1
+        n_inps = Intcode.arities[opval % 100][0]
+        base = comp.base
+        for k,(addr,rel) in enumerate(instr[2]):
+            if not rel and addr == ip + 1 + k:
+                # immediate value, not a memory access
+                continue
+            bucket = (addr + rel*base) // self.bucket_size
+            if k < n_inps:
+                self.reads[bucket] += 1
+            else:
+                self.writes[bucket] += 1
+
+    @property
+    def total(self):
+        return sum(self.executions.values())
+
+    @property
+    def by_opcode(self):
+        counts = Counter()
+        for (ip,opval),n in self.executions.items():
+            counts[opval % 100] += n
+        return counts
+
+    @property
+    def by_ip(self):
+        counts = Counter()
+        for (ip,opval),n in self.executions.items():
+            counts[ip] += n
+        return counts
+
+    @property
+    def by_mode(self):
+        """Counts of parameters per mode (0: pointer, 1: immediate, 2: relative)"""
+        counts = Counter()
+        for (ip,opval),n in self.executions.items():
+            n_inps, n_outs = Intcode.arities[opval % 100]
+            for mode,_ in zip(Intcode.modes_from_op(opval), range(n_inps + n_outs)):
+                counts[mode] += n
+        return counts
+
+    def as_dict(self, top=20):
+        """Summary of the profile as JSON-serializable dict"""
+        total = self.total
+        return {'instructions': total,
+                'seconds': self.elapsed,
+                'instructions_per_sec': total / self.elapsed if self.elapsed else None,
+                'by_opcode': {str(opcode): n for opcode,n in self.by_opcode.most_common()},
+                'by_mode': {str(mode): n for mode,n in sorted(self.by_mode.items())},
+                'hot_ips': [[ip, n] for ip,n in self.by_ip.most_common(top)],
+                'reads': [[bucket*self.bucket_size, n] for bucket,n in self.reads.most_common(top)],
+                'writes': [[bucket*self.bucket_size, n] for bucket,n in self.writes.most_common(top)],
+                }
+
+    def write_json(self, path, top=20):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(top), f, indent=2)
+
+    def report(self, top=20):
+        """Text report of the profile, most frequent items first"""
+        summary = self.as_dict(top)
+        total = summary['instructions'] or 1
+        lines = [f"{summary['instructions']} instructions in {self.elapsed:.3f} s"]
+        if summary['instructions_per_sec']:
+            lines[0] += f" ({summary['instructions_per_sec']:.0f} instructions/s)"
+        lines.append('per opcode:')
+        lines.extend(f'  {opcode:>4} {self.opnames[int(opcode)]:>6}: {n:10d} ({100*n/total:5.1f}%)'
+                     for opcode,n in summary['by_opcode'].items())
+        lines.append('per parameter mode:')
+        lines.extend(f'  {mode:>4}: {n:10d}' for mode,n in summary['by_mode'].items())
+        lines.append('hottest ips:')
+        lines.extend(f'  {ip:6d}: {n:10d} ({100*n/total:5.1f}%)' for ip,n in summary['hot_ips'])
+        for kind in 'reads', 'writes':
+            lines.append(f'{kind} per {self.bucket_size} addresses:')
+            lines.extend(f'  {start:6d}-{start + self.bucket_size - 1:<6d}: {n:10d}' for start,n in summary[kind])
+        return '\n'.join(lines)
+
+class ProfiledMixin:
+    """Instrumented step() and run() for profiled machines, see Intcode.enable_profiling"""
+    __slots__ = ()
+
+    def step(self):
+        start = time.perf_counter()
+        ip = self.ip
+        instr = self.decoded.get(ip) or self.decode(ip)
+        self.profile.record(self, ip, instr)
+        status = super().step()
+        self.profile.elapsed += time.perf_counter() - start
+        return status
+
+    def run(self, until=('input', 'output', 'halt'), max_steps=None):
+        assert set(until) <= {'input', 'output', 'halt'}, f'Invalid stop events {until}!'
+        stop_on_output = 'output' in until
+        profile = self.profile
+        record = profile.record
+        inputs = self.inputs
+        start = time.perf_counter()
+        try:
+            n = 0
+            for n in (count(1) if max_steps is None else range(1, max_steps + 1)):
+                ip = self.ip
+                instr = self.decoded.get(ip) or self.decode(ip)
+                op = instr[1]
+                if op == 'in' and not inputs:
+                    n -= 1
+                    return Status.NEED_INPUT
+                record(self, ip, instr)
+                self.last_op = op
+                instr[0](self, instr)
+                if op is None:
+                    return Status.HALTED
+                if op == 'out' and stop_on_output:
+                    return Status.OUTPUT
+            return Status.BUDGET
+        except Trap:
+            if self.trap[0] is Status.BREAKPOINT:
+                n -= 1
+            return self.trap[0]
+        finally:
+            self.steps += n
+            profile.elapsed += time.perf_counter() - start
+
+
+class Journal:
+    """Log of the inputs consumed by a journaled machine, with snapshots
+
+    Since a machine is deterministic, its state after consuming n inputs
+    is determined by any earlier snapshot and the inputs since then.
+    Snapshots are forked machines taken right before an input instruction,
+    every `every` inputs.
+    """
+    def __init__(self, start, every=64):
+        self.every = every
+        self.inputs = []  # every input consumed so far
+        self.snapshots = [(0, start)]  # (number of inputs consumed, machine), in order
+
+    def record(self, comp):
+        """Log the input comp is about to consume, after a snapshot if one is due"""
+        index = len(self.inputs)
+        if index - self.snapshots[-1][0] >= self.every:
+            self.snapshots.append((index, comp.fork()))
+        self.inputs.append(comp.inputs[0])
+
+class JournaledMixin:
+    """Logging input instruction for journaled machines, see Intcode.enable_journal"""
+    __slots__ = ()
+
+    def do_in(self, instr):
+        self.journal.record(self)
+        super().do_in(instr)
+
+    handlers = {**Intcode.handlers, 3: do_in}
+
+
+class Tracer:
+    """Writer of binary execution traces, see Intcode.enable_tracing
+
+    After a short header (trace_header) the file holds one record of
+    int64 fields (trace_fields) per executed instruction:
+        decoded: row of the instruction in the decode table
+           base: relative base when it was executed
+          value: value written (incl. inputs), or output, 0 otherwise
+    Values that don't fit into 64 bits are clamped. Records are stored in
+    a preallocated array and written in chunks of `buffer_records`.
+
+    The decode table follows the records when the tracer is closed: one
+    row of int64 fields (trace_table_fields) per decoded instruction, then
+    the number of rows. A row holds the ip and opcode of the instruction
+    and an (address, relative) pair for each of its two reads and its
+    write, -1 if immediate or absent. Self-modifying code is decoded again,
+    so an ip can have several rows. See intcode_trace.load_trace for
+    resolving the records into addresses.
+    """
+    def __init__(self, path, buffer_records=65536):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(trace_header.pack(trace_magic, trace_version))
+        self.buffer = array('q', bytes(8 * len(trace_fields) * buffer_records))
+        self.pos = 0  # next free field of the buffer
+        self.records = 0  # number of records flushed to the file
+        self.table = array('q')  # decode table, len(trace_table_fields) per row
+        self.templates = {}  # ip -> (decoded record, row, value address, relative, has value)
+
+    def template(self, comp, ip, instr):
+        """Add a row for a decoded instruction to the table, return its template"""
+        opcode = comp.src[ip] % 100
+        n_inps, n_outs = Intcode.arities[opcode]
+        fields = [(-1, 0)] * 3
+        for k,(addr,rel) in enumerate(instr[2]):
+            immediate = not rel and addr == ip + 1 + k
+            if k < n_inps and not immediate:
+                fields[k] = addr, rel
+        if n_outs:
+            fields[2] = instr[2][-1]
+        row = len(self.table) // len(trace_table_fields)
+        self.table.extend((ip, opcode, *fields[0], *fields[1], *fields[2]))
+        # addresses of relative parameters can be negative offsets, so
+        # whether there's a value is a separate flag
+        if n_outs:
+            template = instr, row, *instr[2][-1], True
+        elif opcode == 4:
+            template = instr, row, *instr[2][0], True
+        else:
+            template = instr, row, 0, 0, False
+        self.templates[ip] = template
+        return template
+
+    def append(self, row, base, value):
+        if self.pos == len(self.buffer):
+            self.flush()
+        buffer = self.buffer
+        pos = self.pos
+        buffer[pos] = row
+        buffer[pos + 1] = clamp64(base)
+        buffer[pos + 2] = clamp64(value)
+        self.pos = pos + 3
+
+    def flush(self):
+        pos = self.pos
+        self.records += pos // len(trace_fields)
+        self.file.write(int64_bytes(self.buffer[:pos]))
+        self.pos = 0
+        self.file.flush()
+
+    def close(self):
+        """Write the remaining records and the decode table, close the file"""
+        if not self.file.closed:
+            self.flush()
+            self.file.write(int64_bytes(self.table))
+            self.file.write(int64_bytes(array('q', [len(self.table) // len(trace_table_fields)])))
+            self.file.close()
+
+class TracedMixin:
+    """Recording step() and run() for traced machines, see Intcode.enable_tracing"""
+    __slots__ = ()
+
+    def step(self):
+        ip = self.ip
+        instr = self.decoded.get(ip) or self.decode(ip)
+        tracer = self.tracer
+        template = tracer.templates.get(ip)
+        if template is None or template[0] is not instr:
+            template = tracer.template(self, ip, instr)
+        _, row, addr, rel, has_value = template
+        base = self.base
+        status = super().step()
+        if status is not Status.BREAKPOINT:
+            tracer.append(row, base, self.src[addr + rel*base] if has_value else 0)
+        return status
+
+    def run(self, until=('input', 'output', 'halt'), max_steps=None):
+        assert set(until) <= {'input', 'output', 'halt'}, f'Invalid stop events {until}!'
+        stop_on_output = 'output' in until
+        tracer = self.tracer
+        templates = tracer.templates
+        buffer = tracer.buffer
+        size = len(buffer)
+        pos = tracer.pos
+        src = self.src
+        inputs = self.inputs
+        n = 0
+        try:
+            for n in (count(1) if max_steps is None else range(1, max_steps + 1)):
+                ip = self.ip
+                instr = self.decoded.get(ip) or self.decode(ip)
+                op = instr[1]
+                if op == 'in' and not inputs:
+                    n -= 1
+                    return Status.NEED_INPUT
+                template = templates.get(ip)
+                if template is None or template[0] is not instr:
+                    template = tracer.template(self, ip, instr)
+                _, row, addr, rel, has_value = template
+                base = self.base
+                self.last_op = op
+                instr[0](self, instr)
+                # records are written straight into the buffer, no tuples
+                if pos == size:
+                    tracer.pos = pos
+                    tracer.flush()
+                    pos = 0
+                buffer[pos] = row
+                try:
+                    buffer[pos + 1] = base
+                    buffer[pos + 2] = src[addr + rel*base] if has_value else 0
+                except OverflowError:
+                    buffer[pos + 1] = clamp64(base)
+                    buffer[pos + 2] = clamp64(src[addr + rel*base] if has_value else 0)
+                pos += 3
+                if op is None:
+                    return Status.HALTED
+                if op == 'out' and stop_on_output:
+                    return Status.OUTPUT
+            return Status.BUDGET
+        except Trap:
+            if self.trap[0] is Status.BREAKPOINT:
+                n -= 1
+            else:
+                # the watched write did happen
+                tracer.pos = pos
+                tracer.append(row, base, src[addr + rel*base])
+                pos = tracer.pos
+            return self.trap[0]
+        finally:
+            tracer.pos = pos
+            self.steps += n
+
+# subclasses of Intcode classes with the mixin of a mode (profiling,
+# journaling or tracing) on top, created on demand: (mixin, class) -> subclass
+mode_classes = {}
+
+def with_mode(cls, mixin):
+    """Subclass of cls with mixin on top, e.g. ProfiledIntcode for ProfiledMixin"""
+    key = mixin, cls
+    if key not in mode_classes:
+        name = mixin.__name__.replace('Mixin', '') + cls.__name__
+        mode_classes[key] = type(name, (mixin, cls), {'__slots__': (), 'mode': key})
+    return mode_classes[key]
+
+def without_mode(cls, mixin=None):
+    """Version of cls without mixin, keeping other modes; without any mode if mixin is None"""
+    mode = cls.__dict__.get('mode')
+    if mode is None:
+        return cls
+    outer, inner = mode
+    inner = without_mode(inner, mixin)
+    if mixin is None or outer is mixin:
+        return inner
+    return with_mode(inner, outer)
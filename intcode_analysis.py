@@ -0,0 +1,249 @@
+from collections import namedtuple
+from intcode import Intcode, Profile
+
+Instruction = namedtuple('Instruction', 'ip opcode modes params')
+Block = namedtuple('Block', 'start end successors')
+
+def parse_program(inp):
+    """Parse a program from its comma-separated text form"""
+    return list(map(int, inp.strip().split(',')))
+
+class Analysis:
+    """Static analysis of an intcode program
+
+    Instructions are recovered starting from ip 0, following jumps with
+    immediate targets. Jumps with pointer or relative targets can't be
+    followed; relative targets are recognized as returns of the usual
+    calling convention, where a call stores its return address relative
+    to the base and then jumps unconditionally:
+
+        add #ret, #0 -> [rb+k]   (push return address)
+        ...                      (push arguments, rebase)
+        jmpif #1, #func          (jump to the function)
+        ret: ...
+
+    the return addresses of these calls are followed as well. A constant
+    pushed further up than right before the jump is only taken for a
+    return address if it's the address after the jump, other constants
+    are more likely arguments.
+
+    Attributes:
+    instructions: dict of ip -> Instruction for every recovered instruction
+          blocks: dict of start ip -> Block, successors is a tuple of block
+                  starts, or None for blocks ending in an indirect jump
+           calls: dict of call ip -> (function ip, return ip)
+         returns: list of ips of jumps to relative targets
+  indirect_jumps: list of ips of jumps to non-immediate targets (incl. returns)
+  self_modifying: list of (ip, address) for pointer writes into recovered code
+ relative_writes: list of ips writing to relative addresses (not checked)
+         invalid: list of reachable ips with an invalid instruction
+    data_regions: list of (start, end) ranges not covered by any instruction
+    """
+    max_call_setup = 8  # instructions between a pushed return address and the jump
+
+    def __init__(self, src):
+        if isinstance(src, str):
+            src = parse_program(src)
+        self.src = src
+        self.instructions = {}
+        self.calls = {}
+        self.returns = []
+        self.indirect_jumps = []
+        self.invalid = []
+        self.recover_instructions()
+        self.code = {addr for ip,instr in self.instructions.items()
+                          for addr in range(ip, ip + 1 + len(instr.params))}
+        self.find_writes()
+        self.build_blocks()
+        self.find_data_regions()
+
+    def decode(self, ip):
+        """Decode the instruction at ip, return None if it's invalid"""
+        src = self.src
+        if not 0 <= ip < len(src):
+            return None
+        opval = src[ip]
+        opcode = opval % 100
+        if opcode not in Intcode.arities:
+            return None
+        n_inps, n_outs = Intcode.arities[opcode]
+        n_params = n_inps + n_outs
+        if ip + n_params >= len(src):
+            return None
+        modes = tuple(opval // 10**k % 10 for k in range(2, 2 + n_params))
+        if not set(modes) <= {0, 1, 2} or (n_outs and modes[-1] == 1):
+            return None
+        return Instruction(ip, opcode, modes, tuple(src[ip + 1:ip + 1 + n_params]))
+
+    @staticmethod
+    def jump_kind(instr):
+        """Return 'always', 'never' or 'maybe' for a conditional jump"""
+        if instr.modes[0] != 1:
+            return 'maybe'
+        return 'always' if bool(instr.params[0]) == (instr.opcode == 5) else 'never'
+
+    def is_indirect(self, instr):
+        """Whether an instruction may jump to a target that's not an immediate"""
+        return instr.opcode in (5, 6) and self.jump_kind(instr) != 'never' and instr.modes[1] != 1
+
+    def successors(self, instr):
+        """Statically known next ips of an instruction"""
+        next_ip = instr.ip + 1 + len(instr.params)
+        if instr.opcode == 99:
+            return []
+        if instr.opcode not in (5, 6):
+            return [next_ip]
+
+        kind = self.jump_kind(instr)
+        succs = [] if kind == 'always' else [next_ip]
+        if kind != 'never' and instr.modes[1] == 1:
+            succs.append(instr.params[1])
+        return succs
+
+    def recover_instructions(self):
+        """Walk the reachable instructions from ip 0"""
+        to_visit = [0]
+        while to_visit:
+            ip = to_visit.pop()
+            if ip in self.instructions:
+                continue
+            instr = self.decode(ip)
+            if instr is None:
+                self.invalid.append(ip)
+                continue
+            self.instructions[ip] = instr
+            succs = self.successors(instr)
+            to_visit.extend(succs)
+            if self.is_indirect(instr):
+                self.indirect_jumps.append(ip)
+                if instr.modes[1] == 2:
+                    self.returns.append(ip)
+
+            # recognize calls: push a constant to the stack, then jump
+            if instr.opcode in (1, 2) and instr.modes == (1, 1, 2):
+                call = self.find_call(instr)
+                if call:
+                    jump_ip, func, ret = call
+                    self.calls[jump_ip] = func, ret
+                    to_visit.append(ret)
+
+        self.returns.sort()
+        self.indirect_jumps.sort()
+        self.invalid.sort()
+
+    def find_call(self, push):
+        """Return (jump ip, function ip, return ip) if push stores a return address, else None"""
+        a,b,_ = push.params
+        ret = a + b if push.opcode == 1 else a * b
+        ip = push.ip + 1 + len(push.params)
+        for n in range(self.max_call_setup + 1):
+            instr = self.decode(ip)
+            if instr is None or instr.opcode == 99:
+                return None
+            next_ip = ip + 1 + len(instr.params)
+            if instr.opcode in (5, 6):
+                if (self.jump_kind(instr) == 'always' and instr.modes[1] == 1
+                    and (n == 0 or ret == next_ip)):
+                    return ip, instr.params[1], ret
+                return None
+            ip = next_ip
+        return None
+
+    def find_writes(self):
+        """Find writes into code"""
+        self.self_modifying = []
+        self.relative_writes = []
+        for ip,instr in sorted(self.instructions.items()):
+            if instr.opcode not in (1, 2, 3, 7, 8):
+                continue
+            if instr.modes[-1] == 2:
+                self.relative_writes.append(ip)
+            elif instr.params[-1] in self.code:
+                self.self_modifying.append((ip, instr.params[-1]))
+
+    def build_blocks(self):
+        """Split the instructions into basic blocks, build the control flow graph"""
+        instrs = self.instructions
+        leaders = {0} | {ret for _,ret in self.calls.values()}
+        for ip,instr in instrs.items():
+            if instr.opcode in (5, 6, 99):
+                leaders.update(self.successors(instr))
+        leaders &= set(instrs)
+
+        self.blocks = {}
+        for start in sorted(leaders):
+            ip = start
+            while True:
+                instr = instrs[ip]
+                next_ip = ip + 1 + len(instr.params)
+                if instr.opcode in (5, 6, 99) or next_ip in leaders or next_ip not in instrs:
+                    break
+                ip = next_ip
+            if self.is_indirect(instr):
+                succs = None
+            elif instr.opcode in (5, 6, 99):
+                succs = tuple(self.successors(instr))
+            else:
+                succs = (next_ip,) if next_ip in instrs else ()
+            self.blocks[start] = Block(start, next_ip, succs)
+
+    def find_data_regions(self):
+        self.data_regions = []
+        start = None
+        size = len(self.src)
+        for addr in range(size + 1):
+            is_data = addr < size and addr not in self.code
+            if is_data and start is None:
+                start = addr
+            elif not is_data and start is not None:
+                self.data_regions.append((start, addr))
+                start = None
+
+    @property
+    def is_self_modifying(self):
+        """Whether the program may write into its own code"""
+        return bool(self.self_modifying)
+
+    @staticmethod
+    def format_instruction(instr):
+        params = []
+        for mode,param in zip(instr.modes, instr.params):
+            if mode == 0:
+                params.append(f'[{param}]')
+            elif mode == 1:
+                params.append(f'#{param}')
+            else:
+                params.append(f'[rb{param:+d}]')
+        name = Profile.opnames[instr.opcode]
+        if instr.opcode in (1, 2, 3, 7, 8):
+            *inps, out = params
+            return f'{name} {", ".join(inps)} -> {out}' if inps else f'{name} -> {out}'
+        return f'{name} {", ".join(params)}'.rstrip()
+
+    def dump(self):
+        """Human-readable listing of blocks, instructions and data"""
+        lines = []
+        data = dict(self.data_regions)
+        for addr in sorted(set(self.blocks) | set(data) | set(self.instructions)):
+            if addr in data:
+                end = data[addr]
+                values = ','.join(map(str, self.src[addr:min(end, addr + 8)]))
+                lines.append(f'{addr:6d}: data[{end - addr}] {values}{",..." if end - addr > 8 else ""}')
+                continue
+            if addr in self.blocks:
+                block = self.blocks[addr]
+                succs = 'indirect' if block.successors is None else ', '.join(map(str, block.successors)) or 'exit'
+                lines.append(f'block {block.start}-{block.end - 1} -> {succs}')
+            instr = self.instructions.get(addr)
+            if instr is None:
+                continue
+            notes = []
+            if addr in self.calls:
+                notes.append(f'call {self.calls[addr][0]}')
+            if addr in self.returns:
+                notes.append('return')
+            if any(ip == addr for ip,_ in self.self_modifying):
+                notes.append('writes code')
+            note = f'  ; {", ".join(notes)}' if notes else ''
+            lines.append(f'{addr:6d}:   {self.format_instruction(instr)}{note}')
+        return '\n'.join(lines)
@@ -0,0 +1,95 @@
+import re
+from intcode import Intcode, Profile
+
+# mnemonics as printed by the profiler and intcode_analysis
+opcodes = {name: opcode for opcode,name in Profile.opnames.items()}
+
+operand_re = re.compile(r'^(?:#(?P<imm>.+)|\[rb(?P<rel>[+-].+)\]|\[(?P<pos>.+)\])$')
+value_re = re.compile(r'^(?P<label>[A-Za-z_]\w*)?\s*(?P<offset>[+-]?\s*\d+)?$')
+
+def assemble(text):
+    """Assemble intcode from text, return the program as a list of ints
+
+    The syntax is the one of Analysis.dump listings, one instruction per
+    line, with parameters written as
+        #5        immediate
+        [5]       position
+        [rb+5]    relative to the base
+    and outputs after an arrow:
+        add [i], #-1 -> [i]
+        in -> [rb+1]
+        jmpif [i], #loop
+    Values can be numbers, labels or label+offset, also as relative
+    offsets ([rb+label], [rb-label+1] is -(label+1)). A line `name:` defines
+    a label, `data 1, 2, label` emits raw values, `;` starts a comment.
+    """
+    # first pass: split lines into (kind, payload), find label addresses
+    labels = {}
+    items = []
+    pos = 0
+    for lineno,line in enumerate(text.splitlines(), start=1):
+        line = line.split(';')[0].strip()
+        while ':' in line:
+            label, line = line.split(':', 1)
+            label = label.strip()
+            assert label not in labels, f'Duplicate label {label} on line {lineno}!'
+            labels[label] = pos
+            line = line.strip()
+        if not line:
+            continue
+
+        name, _, rest = line.partition(' ')
+        if name == 'data':
+            values = [v.strip() for v in rest.split(',')]
+            items.append((lineno, None, values))
+            pos += len(values)
+            continue
+
+        assert name in opcodes, f'Unknown instruction {name} on line {lineno}!'
+        opcode = opcodes[name]
+        inps, _, out = rest.partition('->')
+        operands = [op.strip() for op in inps.split(',') if op.strip()]
+        if out.strip():
+            operands.append(out.strip())
+        n_inps, n_outs = Intcode.arities[opcode]
+        assert len(operands) == n_inps + n_outs, f'Wrong number of parameters on line {lineno}!'
+        assert bool(out.strip()) == bool(n_outs), f'Misplaced output parameter on line {lineno}!'
+        items.append((lineno, opcode, operands))
+        pos += 1 + len(operands)
+
+    def value(expr, lineno):
+        match = value_re.match(expr.strip())
+        assert match and (match['label'] or match['offset']), f'Invalid value {expr} on line {lineno}!'
+        val = 0
+        if match['label']:
+            assert match['label'] in labels, f'Unknown label {match["label"]} on line {lineno}!'
+            val = labels[match['label']]
+        if match['offset']:
+            val += int(match['offset'].replace(' ', ''))
+        return val
+
+    # second pass: emit code
+    program = []
+    for lineno,opcode,operands in items:
+        if opcode is None:
+            program.extend(value(v, lineno) for v in operands)
+            continue
+        params = []
+        opval = opcode
+        for k,operand in enumerate(operands):
+            match = operand_re.match(operand)
+            assert match, f'Invalid parameter {operand} on line {lineno}!'
+            if match['imm'] is not None:
+                assert k < len(operands) - Intcode.arities[opcode][1], f'Immediate output on line {lineno}!'
+                mode, param = 1, value(match['imm'], lineno)
+            elif match['rel'] is not None:
+                # [rb+x] or [rb-x] for any value x
+                sign, expr = match['rel'][0], match['rel'][1:]
+                mode, param = 2, value(expr, lineno) * (-1 if sign == '-' else 1)
+            else:
+                mode, param = 0, value(match['pos'], lineno)
+            opval += mode * 10**(k + 2)
+            params.append(param)
+        program.append(opval)
+        program.extend(params)
+    return program
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from intcode import Intcode, OutputChannel, Status
+
+class AsyncIntcode(Intcode):
+    """Intcode machine whose input instruction awaits an asyncio queue
+
+    Items of the queue are sequences of input values (e.g. packets), so
+    that multi-value messages are always read in one piece.
+    """
+    __slots__ = ('queue',)
+
+    def __init__(self, src, inputs=None, **kwargs):
+        super().__init__(src, inputs, **kwargs)
+        self.queue = asyncio.Queue()
+
+    def fork(self):
+        """Return an independent copy of the machine, with a copy of its queue"""
+        child = super().fork()
+        child.queue = asyncio.Queue()
+        messages = []
+        while not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        for message in messages:
+            self.queue.put_nowait(message)
+            child.queue.put_nowait(message)
+        return child
+
+    async def read_input(self):
+        """Return the next input message once there is one"""
+        return await self.queue.get()
+
+    async def run_async(self):
+        """Run the program until it halts, letting other tasks run after every output
+
+        Returns the Status the run ended with (HALTED, or a breakpoint or watchpoint).
+        """
+        while True:
+            status = self.run()
+            if status is Status.OUTPUT:
+                await asyncio.sleep(0)
+            elif status is Status.NEED_INPUT:
+                self.inputs.extend(await self.read_input())
+            else:
+                return status
+
+class NIC(AsyncIntcode):
+    """Network interface: reads -1 when there's no packet, parks when idle
+
+    When a NIC asks for input with an empty queue, it gets a -1 and the
+    state of the machine (ip, base and memory) is remembered. If it comes
+    back for input in the very same state without sending anything, then
+    reading -1 had no effect: the machine would spin forever, so instead
+    it's parked until a packet arrives. NICs whose idle loop changes
+    memory (e.g. counting polls) never park; see Network for those.
+
+    Outputs are framed into (address, x, y) packets which are sent as
+    soon as they're complete.
+    """
+    __slots__ = ('network', 'poll_state')
+
+    def __init__(self, src, addr, network, **kwargs):
+        super().__init__(src, [addr], outputs=OutputChannel(3, on_record=self.send), **kwargs)
+        self.network = network
+        self.poll_state = None  # (ip, base, memory) when we last read a -1
+
+    def fork(self):
+        """Return a copy of the NIC, sending on the same network
+
+        The network still routes packets for the address to the original.
+        """
+        child = super().fork()
+        child.outputs.on_record = child.send
+        child.network = self.network
+        child.poll_state = self.poll_state
+        return child
+
+    def send(self, packet):
+        self.poll_state = None
+        self.network.send(packet)
+
+    async def read_input(self):
+        if not self.queue.empty():
+            self.poll_state = None
+            return self.queue.get_nowait()
+
+        state = self.poll_state
+        if state is None or state[:2] != (self.ip, self.base) or state[2] != self.src:
+            # the machine did something since the last -1, poll again,
+            # but let the others run first: it may change memory on every poll
+            self.poll_state = self.ip, self.base, self.src.copy()
+            self.network.polled(self)
+            await asyncio.sleep(0)
+            return (-1,)
+
+        # idle: park until a packet arrives
+        network = self.network
+        network.parked.add(self)
+        network.check_idle()
+        packet = await self.queue.get()
+        network.parked.discard(self)
+        self.poll_state = None
+        return packet
+
+class Network:
+    """A network of NICs running the same program, with a NAT at address 255
+
+    When every NIC is parked and there are no packets in flight, the NAT
+    sends its last received packet to address 0. As a fallback for NICs
+    that never park, a NIC that read -1 twice since the last packet was
+    sent anywhere counts as idle too.
+    """
+    def __init__(self, src, num_procs=50, **kwargs):
+        self.nics = {addr: NIC(src, addr, self, **kwargs) for addr in range(num_procs)}
+        self.parked = set()  # NICs waiting for a packet
+        self.polls = {}  # NIC -> number of -1 reads since the last packet
+        self.polls_since = 0  # num_packets when polls were last cleared
+        self.num_packets = 0  # packets sent, including to and from the NAT
+        self.num_dropped = 0  # packets sent to addresses that aren't on the network
+        self.elapsed = None  # wall time of the last run in seconds
+        self.idle = asyncio.Event()
+        self.nat_packet = None  # last packet sent to the NAT
+        self.first_nat_y = None  # y of the first packet sent to the NAT
+        self.last_sent_y = None  # y of the last packet the NAT sent
+
+    def check_idle(self):
+        if not all(nic.queue.empty() for nic in self.nics.values()):
+            return
+        if len(self.parked) < len(self.nics):
+            self.forget_polls()
+            if not all(nic in self.parked or self.polls.get(nic, 0) >= 2 for nic in self.nics.values()):
+                return
+        self.idle.set()
+
+    def polled(self, nic):
+        """Count a -1 read by nic"""
+        self.forget_polls()
+        polls = self.polls[nic] = self.polls.get(nic, 0) + 1
+        if polls == 2:
+            self.check_idle()
+
+    def forget_polls(self):
+        # polls only count since the last packet
+        if self.polls_since != self.num_packets:
+            self.polls_since = self.num_packets
+            self.polls.clear()
+
+    def send(self, packet):
+        """Route an (address, x, y) output packet"""
+        to, x, y = packet
+        self.num_packets += 1
+
+        if to == 255:
+            if self.nat_packet is None:
+                self.first_nat_y = y
+            self.nat_packet = x, y
+        elif to in self.nics:
+            self.nics[to].queue.put_nowait((x, y))
+        else:
+            self.num_dropped += 1
+
+    async def run_nat(self):
+        """Wake up the network whenever it's idle, until the NAT repeats itself"""
+        while True:
+            await self.idle.wait()
+            self.idle.clear()
+            assert self.nat_packet is not None, 'Network is idle without any NAT packets!'
+            x,y = self.nat_packet
+            if y == self.last_sent_y:
+                return y
+            self.last_sent_y = y
+            self.num_packets += 1
+            self.nics[0].queue.put_nowait((x, y))
+
+    async def run(self):
+        """Run the network, return (first y sent to the NAT, first y the NAT sent twice in a row)"""
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(nic.run_async()) for nic in self.nics.values()]
+        try:
+            repeated_y = await self.run_nat()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.elapsed = time.perf_counter() - start
+        return self.first_nat_y, repeated_y
+
+    def simulate(self):
+        """Synchronous entry point for run"""
+        return asyncio.run(self.run())
+
+    def report(self):
+        """Summarize traffic and per-NIC instruction counts of the last run"""
+        lines = [f'{self.num_packets} packets in {self.elapsed:.3f} s '
+                 f'({self.num_packets/self.elapsed:.0f} packets/s), {self.num_dropped} dropped']
+        lines.extend(f'NIC {addr:3d}: {nic.steps} instructions' for addr,nic in self.nics.items())
+        return '\n'.join(lines)
+
+def run_network(src, num_procs=50, **kwargs):
+    """Run a network, return its results without the statistics"""
+    return Network(src, num_procs, **kwargs).simulate()
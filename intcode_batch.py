@@ -0,0 +1,165 @@
+from itertools import repeat
+import numpy as np
+
+class IntcodeBatch:
+    """Many instances of an intcode program running in lockstep
+
+    Memory is a 2d int64 array with one row per machine. In every pass the
+    active machines are grouped by the instruction they are about to
+    execute (opcode and parameter modes), and each group is executed with
+    vectorized numpy operations. Machines that branch apart simply end up
+    in different groups, and they get regrouped whenever they execute the
+    same kind of instruction again.
+
+    Values have to fit in int64: there's no fallback for big ints. Memory
+    is dense and every row is as long as the highest address any machine
+    touched, so a single machine using a high address (say 10**6) grows
+    the memory of all of them; such programs are better run on their own.
+    Growing beyond max_cells cells in total fails instead of exhausting
+    memory.
+    """
+    # number of parameters for each opcode
+    n_params = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1, 99: 0}
+    max_cells = 2**28  # total int64 cells of memory, 2 GiB
+
+    def __init__(self, src, inputs=None, n=None):
+        """Set up the machines
+
+        Input:
+           src: a single program to run in every machine, or a 2d array
+                with one (e.g. patched) program per row
+        inputs: 2d array with one row of inputs per machine, or None
+             n: number of machines if it can't be inferred from src or inputs
+        """
+        mem = np.array(src, dtype=np.int64)
+        if mem.ndim == 1:
+            if n is None:
+                n = len(inputs)
+            mem = np.tile(mem, (n, 1))
+        n = len(mem)
+
+        self.mem = mem
+        if inputs is None:
+            inputs = np.zeros((n, 0), dtype=np.int64)
+        self.inputs = np.array(inputs, dtype=np.int64).reshape(n, -1)
+        self.inputs_read = np.zeros(n, dtype=np.int64)
+        self.ip = np.zeros(n, dtype=np.int64)
+        self.base = np.zeros(n, dtype=np.int64)
+        self.running = np.ones(n, dtype=bool)
+        self.starved = np.zeros(n, dtype=bool)  # stopped on an input with no inputs left
+        self.outputs = [[] for _ in range(n)]
+
+    def ensure_size(self, size):
+        """Grow memory so that addresses up to size - 1 are valid"""
+        n, old_size = self.mem.shape
+        if size > old_size:
+            assert n*size <= self.max_cells, \
+                f'Batch memory would grow to {n}x{size} cells, address {size - 1} is too high for a batch!'
+            extra = min(max(size, 2*old_size), self.max_cells // n) - old_size
+            self.mem = np.pad(self.mem, ((0, 0), (0, extra)))
+
+    def run(self, max_steps=None):
+        """Run until every machine halts or starves, or for max_steps passes
+
+        Returns the number of lockstep passes taken.
+        """
+        passes = 0
+        for _ in (repeat(None) if max_steps is None else range(max_steps)):
+            rows = np.flatnonzero(self.running)
+            if not rows.size:
+                break
+            passes += 1
+
+            ips = self.ip[rows]
+            self.ensure_size(ips.max() + 4)
+            instrs = self.mem[rows[:, None], ips[:, None] + np.arange(4)]
+            opvals = instrs[:, 0]
+
+            # group machines by opcode and parameter modes
+            if (opvals == opvals[0]).all():
+                self.execute(opvals[0], rows, instrs[:, 1:])
+            else:
+                kinds, inverse = np.unique(opvals, return_inverse=True)
+                for i_kind,opval in enumerate(kinds):
+                    mask = inverse == i_kind
+                    self.execute(opval, rows[mask], instrs[mask, 1:])
+        return passes
+
+    def address(self, rows, param, mode):
+        """Memory addresses for pointer and relative parameters"""
+        assert mode in (0, 2), f'Invalid address mode {mode}!'
+        addr = param if mode == 0 else self.base[rows] + param
+        assert (addr >= 0).all(), f'Invalid index {addr.min()}!'
+        self.ensure_size(addr.max() + 1)
+        return addr
+
+    def value(self, rows, param, mode):
+        if mode == 1:
+            return param
+        addr = self.address(rows, param, mode)
+        return self.mem[rows, addr]
+
+    def execute(self, opval, rows, params):
+        """Execute one kind of instruction for a group of machines"""
+        opcode = opval % 100
+        assert opcode in self.n_params, f'Invalid opcode {opcode}!'
+        modes = [opval // 10**k % 10 for k in range(2, 5)]
+        ip = self.ip
+
+        if opcode == 99:
+            self.running[rows] = False
+            ip[rows] += 1
+            return
+
+        if opcode == 3:
+            starved = self.inputs_read[rows] >= self.inputs.shape[1]
+            self.running[rows[starved]] = False
+            self.starved[rows[starved]] = True
+            rows = rows[~starved]
+            params = params[~starved]
+            if not rows.size:
+                return
+            addr = self.address(rows, params[:, 0], modes[0])
+            self.mem[rows, addr] = self.inputs[rows, self.inputs_read[rows]]
+            self.inputs_read[rows] += 1
+            ip[rows] += 2
+            return
+
+        a = self.value(rows, params[:, 0], modes[0])
+        if opcode == 4:
+            for row,val in zip(rows.tolist(), a.tolist()):
+                self.outputs[row].append(val)
+            ip[rows] += 2
+        elif opcode == 9:
+            self.base[rows] += a
+            ip[rows] += 2
+        elif opcode in (5, 6):
+            b = self.value(rows, params[:, 1], modes[1])
+            jump = a != 0 if opcode == 5 else a == 0
+            ip[rows] = np.where(jump, b, ip[rows] + 3)
+        else:
+            b = self.value(rows, params[:, 1], modes[1])
+            if opcode == 1:
+                res = a + b
+            elif opcode == 2:
+                res = a * b
+            elif opcode == 7:
+                res = (a < b).astype(np.int64)
+            else:
+                res = (a == b).astype(np.int64)
+            addr = self.address(rows, params[:, 2], modes[2])
+            self.mem[rows, addr] = res
+            ip[rows] += 4
+
+def run_batch(src, inputs=None, n=None, max_steps=None):
+    """Run a batch of intcode machines to completion
+
+    See IntcodeBatch for the meaning of the arguments.
+
+    Returns in a tuple:
+    outputs: list of output lists, one for each machine
+     memory: 2d array with the final memory of each machine
+    """
+    batch = IntcodeBatch(src, inputs, n)
+    batch.run(max_steps)
+    return batch.outputs, batch.mem
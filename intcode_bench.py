@@ -0,0 +1,229 @@
+import argparse
+import json
+import math
+import time
+import tracemalloc
+from intcode import Intcode, PagedMemory
+from intcode_asm import assemble
+
+# synthetic programs, each stressing a different part of the machine
+workloads = {}
+
+workloads['arith'] = '''
+; tight arithmetic loop: acc = acc + 3*i, wrapped below 10^6, for i = n..1
+    in -> [i]
+loop:
+    mul [i], #3 -> [t]
+    add [t], [acc] -> [acc]
+    lt [acc], #1000000 -> [c]
+    jmpif [c], #next
+    add [acc], #-1000000 -> [acc]
+next:
+    add [i], #-1 -> [i]
+    jmpif [i], #loop
+    out [acc]
+    halt
+i: data 0
+t: data 0
+c: data 0
+acc: data 0
+'''
+
+workloads['recursion'] = '''
+; naive recursive fibonacci with stack frames on the relative base:
+; [rb+0] is the return address, [rb+1] the argument and the result
+    rebase #stack
+    in -> [rb+1]
+    add #done, #0 -> [rb+0]
+    jmpif #1, #fib
+done:
+    out [rb+1]
+    halt
+fib:
+    lt [rb+1], #2 -> [rb+2]
+    jmpif [rb+2], #fib_ret
+    add #fib_r1, #0 -> [rb+3]
+    add [rb+1], #-1 -> [rb+4]
+    rebase #3
+    jmpif #1, #fib
+fib_r1:
+    rebase #-3
+    add [rb+4], #0 -> [rb+5]
+    add #fib_r2, #0 -> [rb+6]
+    add [rb+1], #-2 -> [rb+7]
+    rebase #6
+    jmpif #1, #fib
+fib_r2:
+    rebase #-6
+    add [rb+5], [rb+7] -> [rb+1]
+fib_ret:
+    jmpif #1, [rb+0]
+stack: data 0
+'''
+
+workloads['sparse'] = '''
+; n passes of read-modify-write over 1000 cells spread out above address 10^9
+    in -> [n]
+    rebase #1000000000
+pass:
+    add #1000, #0 -> [k]
+cell:
+    rebase #10007
+    add [rb+0], [n] -> [rb+0]
+    add [rb+0], [acc] -> [acc]
+    add [k], #-1 -> [k]
+    jmpif [k], #cell
+    rebase #-10007000
+    add [n], #-1 -> [n]
+    jmpif [n], #pass
+    out [acc]
+    halt
+n: data 0
+k: data 0
+acc: data 0
+'''
+
+workloads['io'] = '''
+; running sum of the inputs until a 0, one output per input
+loop:
+    in -> [x]
+    jmpifn [x], #end
+    add [x], [acc] -> [acc]
+    out [acc]
+    jmpif #1, #loop
+end:
+    halt
+x: data 0
+acc: data 0
+'''
+
+workloads['selfmod'] = '''
+; patches the immediate of its own add instruction in every iteration
+    in -> [n]
+loop:
+patch:
+    add #0, [acc] -> [acc]
+    add [patch+1], #1 -> [patch+1]
+    add [n], #-1 -> [n]
+    jmpif [n], #loop
+    out [acc]
+    halt
+n: data 0
+acc: data 0
+'''
+
+workloads['counted'] = '''
+; multiplication by repeated addition: acc = sum of 1000*i for i = n..1
+    in -> [i]
+outer:
+    add #1000, #0 -> [j]
+inner:
+    add [i], [acc] -> [acc]
+    add [j], #-1 -> [j]
+    jmpif [j], #inner
+    add [i], #-1 -> [i]
+    jmpif [i], #outer
+    out [acc]
+    halt
+i: data 0
+j: data 0
+acc: data 0
+'''
+
+def workload_inputs(name, scale=1):
+    """Inputs of a workload for a given scale, about a million instructions at scale 1"""
+    if name == 'arith':
+        return [int(150000*scale)]
+    if name == 'recursion':
+        # instructions grow by the golden ratio per level
+        return [max(2, 24 + round(math.log(scale) / math.log((1 + 5**0.5) / 2)))]
+    if name == 'sparse':
+        return [int(200*scale)]
+    if name == 'io':
+        return list(range(1, int(250000*scale) + 1)) + [0]
+    if name == 'selfmod':
+        return [int(250000*scale)]
+    if name == 'counted':
+        return [int(333*scale)]
+    assert False, f'Unknown workload {name}!'
+
+# Intcode configurations to compare
+backends = {'interpreted': {'fuse': False},
+            'fused': {},
+            'accelerated': {'accelerate': True},
+            'compiled': {'compiled': True},
+            'paged': {'memory': PagedMemory},
+            }
+
+def run_once(src, inputs, options):
+    comp = Intcode(src, inputs, **options)
+    start = time.perf_counter()
+    comp.run(until={'halt'})
+    elapsed = time.perf_counter() - start
+    return comp, elapsed
+
+def measure(name, backend, scale=1, repeat=3):
+    """Time a workload on a backend, return a dict of results
+
+    The best of `repeat` runs is reported. Peak memory is measured in a
+    separate run, since tracing allocations slows everything down.
+    """
+    src = assemble(workloads[name])
+    inputs = workload_inputs(name, scale)
+    options = backends[backend]
+    best = None
+    for _ in range(repeat):
+        comp, elapsed = run_once(src, inputs, options)
+        if best is None or elapsed < best:
+            best = elapsed
+    steps = comp.steps
+
+    tracemalloc.start()
+    run_once(src, inputs, options)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'workload': name,
+            'backend': backend,
+            'instructions': steps,
+            'seconds': best,
+            'instructions_per_sec': steps / best,
+            'ns_per_op': 1e9 * best / steps,
+            'peak_bytes': peak,
+            'result': comp.outputs[-1],
+            }
+
+def run_suite(names=None, backend_names=None, scale=1, repeat=3):
+    """Measure every workload on every backend, return the list of results"""
+    results = []
+    for name in names or workloads:
+        for backend in backend_names or backends:
+            results.append(measure(name, backend, scale, repeat))
+    return results
+
+def report(results):
+    """Text table of the results"""
+    lines = [f'{"workload":>10} {"backend":>12} {"instrs":>10} {"Mips":>7} {"ns/op":>7} {"peak MiB":>9}']
+    for res in results:
+        lines.append(f'{res["workload"]:>10} {res["backend"]:>12} {res["instructions"]:10d} '
+                     f'{res["instructions_per_sec"]/1e6:7.2f} {res["ns_per_op"]:7.0f} '
+                     f'{res["peak_bytes"]/2**20:9.2f}')
+    return '\n'.join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Throughput benchmark of intcode backends')
+    parser.add_argument('--workloads', help='comma-separated subset of ' + ','.join(workloads))
+    parser.add_argument('--backends', help='comma-separated subset of ' + ','.join(backends))
+    parser.add_argument('--scale', type=float, default=1, help='size of the workloads (1: ~1M instructions)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement, best is kept')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run_suite(args.workloads and args.workloads.split(','),
+                        args.backends and args.backends.split(','),
+                        args.scale, args.repeat)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scale': args.scale,
+                       'results': results}, f, indent=2)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import sqlite3
+from collections import OrderedDict
+from intcode import Intcode
+
+def program_digest(src):
+    """Hex digest identifying a program"""
+    return hashlib.sha1(','.join(map(str, src)).encode('ascii')).hexdigest()
+
+class RunCache:
+    """Memoized runs of a single intcode program
+
+    A run starts from the fresh program with a given sequence of inputs,
+    and lasts until the program halts or runs out of inputs. Since such
+    a run is a pure function of the program and the inputs, its outputs
+    are cached under (program hash, inputs): first in an in-memory LRU,
+    and optionally in an sqlite database that survives between sessions.
+
+    Input:
+            src: list of ints with the program (copied)
+        maxsize: number of runs to keep in memory
+           path: optional sqlite database file for the on-disk store
+     disk_limit: number of runs to keep on disk, least recently used
+                 runs are evicted beyond this
+        options: keyword arguments for Intcode (e.g. compiled=True)
+    """
+    def __init__(self, src, maxsize=4096, path=None, disk_limit=100000, **options):
+        self.src = tuple(src)
+        self.digest = program_digest(self.src)
+        self.maxsize = maxsize
+        self.options = options
+        self.machine = None  # prepared machine reset for every miss, created on the first one
+        self.lru = OrderedDict()  # tuple of inputs -> tuple of outputs
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        self.disk_limit = disk_limit
+        self.clock = 0  # last use counter for evicting from disk
+        if path:
+            self.db = sqlite3.connect(path)
+            self.db.execute('CREATE TABLE IF NOT EXISTS runs '
+                            '(program TEXT, inputs TEXT, outputs TEXT, used INTEGER, '
+                            'PRIMARY KEY (program, inputs))')
+            self.clock = self.db.execute('SELECT COALESCE(MAX(used), 0) FROM runs').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Write pending runs to disk and close the database"""
+        if self.db:
+            self.evict()
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def run(self, inputs):
+        """Return the outputs of the program for a sequence of inputs, as a tuple"""
+        key = tuple(inputs)
+        outputs = self.lru.get(key)
+        if outputs is not None:
+            self.lru.move_to_end(key)
+            self.hits += 1
+            return outputs
+
+        outputs = self.load(key)
+        if outputs is None:
+            self.misses += 1
+            if self.machine is None:
+                self.machine = Intcode.prepare(self.src, **self.options)
+            comp = self.machine
+            comp.reset()
+            comp.inputs.extend(key)
+            comp.run(until={'halt'})
+            outputs = tuple(comp.outputs)
+            self.store(key, outputs)
+        else:
+            self.hits += 1
+
+        self.lru[key] = outputs
+        if len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
+        return outputs
+
+    def load(self, key):
+        """Look up a run on disk, None if it's not there"""
+        if not self.db:
+            return None
+        inputs = json.dumps(key)
+        row = self.db.execute('SELECT outputs FROM runs WHERE program = ? AND inputs = ?',
+                              (self.digest, inputs)).fetchone()
+        if row is None:
+            return None
+        self.clock += 1
+        self.db.execute('UPDATE runs SET used = ? WHERE program = ? AND inputs = ?',
+                        (self.clock, self.digest, inputs))
+        return tuple(json.loads(row[0]))
+
+    def store(self, key, outputs):
+        if not self.db:
+            return
+        self.clock += 1
+        self.db.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)',
+                        (self.digest, json.dumps(key), json.dumps(outputs), self.clock))
+        if self.clock % 1000 == 0:
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        """Drop the least recently used runs beyond disk_limit"""
+        count = self.db.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+        if count > self.disk_limit:
+            self.db.execute('DELETE FROM runs WHERE rowid IN '
+                            '(SELECT rowid FROM runs ORDER BY used LIMIT ?)',
+                            (count - self.disk_limit,))
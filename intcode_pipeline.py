@@ -0,0 +1,157 @@
+import time
+from itertools import chain
+from collections import deque
+from intcode import Status
+
+class Channel(deque):
+    """Bounded FIFO connecting the output of one machine to the input of another
+
+    A channel is used as the outputs of its writer and the inputs of its
+    reader. The capacity isn't enforced by append: it's up to the
+    Pipeline to stop a writer once its channel is full.
+    """
+    def __init__(self, values=(), capacity=16):
+        super().__init__(values)
+        self.capacity = capacity
+
+    @property
+    def full(self):
+        return len(self) >= self.capacity
+
+    def copy(self):
+        return Channel(self, self.capacity)
+
+class Pipeline:
+    """Chain of machines connected by bounded channels, run by a scheduler
+
+    The outputs of each machine are the inputs of the next one, and with
+    ring=True the outputs of the last one feed back into the first one.
+    Inputs already queued on a machine stay queued in its input channel
+    (e.g. phase settings), even beyond the capacity. Without a ring, the
+    outputs of the last machine are left alone.
+
+    A machine keeps running until it halts, its input channel is empty or
+    its output channel is full; only then the scheduler switches, to the
+    machine on the other side of the channel if it can run. Once the
+    reader of a channel halted, the channel is unbounded, so that its
+    writer can run to the end.
+
+    Attributes:
+        machines: the connected Intcode machines
+        channels: channel k connects machines k and k+1 (mod n)
+      last_value: last value each machine output, None before its first output
+        switches: number of times the scheduler switched machines
+         stalled: seconds each machine spent blocked on a channel
+          stalls: number of times each machine blocked on a channel
+    """
+    def __init__(self, machines, capacity=16, ring=False):
+        self.machines = list(machines)
+        n = len(self.machines)
+        self.ring = ring
+        self.channels = []
+        for k in range(n if ring else n - 1):
+            reader = self.machines[(k + 1) % n]
+            channel = Channel(reader.inputs, capacity)
+            self.machines[k].outputs = reader.inputs = channel
+            self.channels.append(channel)
+
+        self.status = [None] * n  # status of each machine's last run
+        self.last_value = [None] * n
+        self.switches = 0
+        self.stalled = [0.0] * n
+        self.stalls = [0] * n
+        self.blocked_since = [None] * n  # perf_counter of blocking, None while runnable
+
+    def runnable(self, k):
+        status = self.status[k]
+        comp = self.machines[k]
+        if status is Status.HALTED:
+            return False
+        if status is Status.NEED_INPUT:
+            return bool(comp.inputs)
+        if status is Status.OUTPUT:
+            return not self.blocked_on_output(k)
+        return True
+
+    def blocked_on_output(self, k):
+        """Whether machine k has to wait for its output channel to drain"""
+        return self.status[(k + 1) % len(self.machines)] is not Status.HALTED and self.machines[k].outputs.full
+
+    def run_machine(self, k):
+        """Run machine k until it blocks or halts, return its status"""
+        comp = self.machines[k]
+        outputs = comp.outputs
+        if not isinstance(outputs, Channel):
+            # unbounded sink, only stop for input
+            status = comp.run(until={'input', 'halt'})
+            if outputs:
+                self.last_value[k] = outputs[-1]
+            return status
+
+        while True:
+            status = comp.run()
+            if status is not Status.OUTPUT:
+                return status
+            self.last_value[k] = outputs[-1]
+            if self.blocked_on_output(k):
+                return status
+
+    def run(self):
+        """Run until every machine halts or is blocked, return the final Status
+
+        That's HALTED if every machine halted, NEED_INPUT if the first
+        machine of a pipeline without a ring waits for inputs, DEADLOCK if
+        the machines are blocked on each other (or on a halted writer), and
+        BREAKPOINT or WATCHPOINT if a machine stopped at one; run() again
+        to continue after feeding inputs or handling the stop.
+        """
+        n = len(self.machines)
+        blocked_since = self.blocked_since
+        k = self.next_machine(range(n))
+        while k is not None:
+            since = blocked_since[k]
+            if since is not None:
+                self.stalled[k] += time.perf_counter() - since
+                blocked_since[k] = None
+
+            status = self.status[k] = self.run_machine(k)
+            if status in (Status.BREAKPOINT, Status.WATCHPOINT):
+                self.stop_clocks()
+                return status
+            if status is not Status.HALTED:
+                blocked_since[k] = time.perf_counter()
+                self.stalls[k] += 1
+
+            # prefer the machine that can unblock this one
+            peer = (k + 1) % n if status is Status.OUTPUT else (k - 1) % n
+            j = self.next_machine(chain([peer], ((k + i) % n for i in range(1, n + 1))))
+            if j is not None and j != k:
+                self.switches += 1
+            k = j
+
+        self.stop_clocks()
+        if all(status is Status.HALTED for status in self.status):
+            return Status.HALTED
+        if not self.ring and self.status[0] is Status.NEED_INPUT:
+            return Status.NEED_INPUT
+        return Status.DEADLOCK
+
+    def next_machine(self, candidates):
+        """First runnable machine among candidates, None if there's none"""
+        return next((k for k in candidates if self.runnable(k)), None)
+
+    def stop_clocks(self):
+        """Count stalls up to now, time between runs doesn't count"""
+        now = time.perf_counter()
+        for k,since in enumerate(self.blocked_since):
+            if since is not None:
+                self.stalled[k] += now - since
+                self.blocked_since[k] = None
+
+    def report(self):
+        """Summarize per-machine statistics of the runs so far"""
+        lines = [f'{self.switches} switches']
+        for k,comp in enumerate(self.machines):
+            lines.append(f'stage {k}: {comp.steps} instructions, {self.stalls[k]} stalls, '
+                         f'{self.stalled[k]*1000:.3f} ms stalled')
+        return '\n'.join(lines)
@@ -0,0 +1,43 @@
+from multiprocessing import Pool, cpu_count
+from intcode import Intcode
+
+# per-process state of pool workers, set once by init_worker
+worker_program = None
+worker_options = {}
+
+def init_worker(src, options):
+    """Store the program in the worker process so jobs only carry inputs"""
+    global worker_program, worker_options
+    worker_program = src
+    worker_options = options
+
+def run_program(inputs):
+    """Run the worker's program on a set of inputs, return its outputs"""
+    comp = Intcode(worker_program, inputs, **worker_options)
+    comp.run(until={'halt'})
+    return comp.outputs
+
+def map_programs(src, input_sets, workers=None, chunksize=None, **options):
+    """Run a program on many independent input sets in a process pool
+
+    Input:
+           src: list of ints with the program, sent to each worker once
+    input_sets: iterable of input sequences, one per run
+       workers: number of worker processes, defaults to the number of cores
+     chunksize: number of input sets sent to a worker at a time
+       options: keyword arguments for Intcode (e.g. compiled=True)
+
+    Every run lasts until the program halts or runs out of inputs.
+    Returns the list of outputs of each run, in the order of input_sets.
+    """
+    if workers is None:
+        workers = cpu_count()
+    if chunksize is None:
+        # a few chunks per worker balances load without much messaging
+        try:
+            chunksize = max(1, len(input_sets) // (4*workers))
+        except TypeError:
+            chunksize = 16
+
+    with Pool(workers, initializer=init_worker, initargs=(src, options)) as pool:
+        return list(pool.imap(run_program, input_sets, chunksize))
@@ -0,0 +1,209 @@
+import hashlib
+import heapq
+import weakref
+from collections import deque
+from intcode import Intcode, PagedMemory, Status
+
+# id of a memory page -> (weak reference to the page, digest of the page)
+page_digests = {}
+zero_page = bytes(8 << PagedMemory.page_bits)
+
+def page_digest(page, shared=True):
+    """Digest of a memory page, None for a page of zeros
+
+    Shared pages are copy-on-write: nobody writes to them anymore, so
+    their digests are cached. Forked machines share most of their pages,
+    so only the pages they wrote since the fork are hashed.
+    """
+    if not shared:
+        data = page.tobytes()
+        return None if data == zero_page else hashlib.blake2b(data, digest_size=16).digest()
+    entry = page_digests.get(id(page))
+    if entry and entry[0]() is page:
+        return entry[1]
+    digest = page_digest(page, shared=False)
+    page_digests[id(page)] = weakref.ref(page, lambda _, key=id(page): page_digests.pop(key, None)), digest
+    return digest
+
+def state_key(comp):
+    """Hashable key of the state of a machine: ip, base and a digest of memory
+
+    Memory is hashed page by page with PagedMemory (see page_digest),
+    any other memory is hashed in full, so keys are only comparable
+    between machines with the same kind of memory. Cells set to 0 and
+    unset cells are the same.
+    """
+    src = comp.src
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(src, PagedMemory):
+        for index,page in sorted(src.pages.items()):
+            page_hash = page_digest(page, index not in src.owned)
+            if page_hash is not None:
+                digest.update(index.to_bytes(8, 'little', signed=True))
+                digest.update(page_hash)
+        big = src.big
+    else:
+        big = {addr: val for addr,val in src.items() if val}
+    digest.update(repr(sorted(big.items())).encode('ascii'))
+    return comp.ip, comp.base, digest.digest()
+
+class Node:
+    """State of a search: a machine waiting for input (or halted) and how it got there
+
+    The machine is dropped once the node is expanded, so that memory is
+    only spent on the frontier of the search.
+    """
+    __slots__ = ('comp', 'status', 'parent', 'move', 'depth', 'outputs', 'info')
+
+    def __init__(self, comp, status, parent=None, move=None, info=None):
+        self.comp = comp
+        self.status = status
+        self.parent = parent
+        self.move = move  # input that led here from the parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.outputs = comp.outputs  # outputs since the parent
+        self.info = info  # user data, see Search
+
+    @property
+    def path(self):
+        """Moves from the start to this node"""
+        moves = []
+        node = self
+        while node.parent:
+            moves.append(node.move)
+            node = node.parent
+        return moves[::-1]
+
+    @property
+    def text(self):
+        """Outputs since the parent as ASCII text, non-ASCII values are skipped"""
+        return ''.join(chr(val) for val in self.outputs if 0 <= val < 128)
+
+class Search:
+    """Search over the states a program can reach at its input points
+
+    From every state, each move of the input alphabet is tried on a fork
+    of the machine, which then runs until it asks for input again or
+    halts. States are visited in breadth-first, depth-first or best-first
+    (lowest priority first) order, and states seen before are dropped.
+    Iterating yields the visited nodes in order, starting with the start.
+
+    Input:
+           start: program (list of ints) or machine to start from (forked)
+           moves: list of moves, or function of a node returning one; a
+                  move is an int, a sequence of ints or a line of text
+           prune: optional function of a new node, True drops the node
+                  (e.g. based on its outputs)
+             key: function of a node giving the state to deduplicate on,
+                  by default state_key of the machine
+            info: optional function (parent node, move, outputs) -> user
+                  data of a new node, e.g. a position
+      start_info: user data of the start node
+        strategy: 'bfs', 'dfs' or 'best'
+        priority: function of a node, for best-first search
+          budget: optional number of instructions per move, moves that
+                  take longer are dropped
+      max_states: optional number of states to visit at most
+    """
+    def __init__(self, start, moves, prune=None, key=None, info=None, start_info=None,
+                 strategy='bfs', priority=None, budget=None, max_states=None):
+        assert strategy in ('bfs', 'dfs', 'best'), f'Invalid strategy {strategy}!'
+        assert strategy != 'best' or priority, 'Best-first search needs a priority!'
+        if isinstance(start, Intcode):
+            comp = start.fork()
+        else:
+            # paged memory makes forks share unchanged pages, and state_key incremental
+            comp = Intcode(start, memory=PagedMemory)
+        comp.outputs = []
+        comp.text_pos = 0
+        status = comp.run(until={'input', 'halt'}, max_steps=budget)
+        self.start = Node(comp, status, info=start_info)
+        self.moves = moves
+        self.prune = prune
+        self.key = key or (lambda node: state_key(node.comp))
+        self.info = info
+        self.strategy = strategy
+        self.priority = priority
+        self.budget = budget
+        self.max_states = max_states
+        self.seen = set()
+        self.visited = 0  # nodes yielded
+        self.duplicates = 0  # nodes dropped as seen before
+        self.pruned = 0  # nodes dropped by prune or for running out of budget
+
+    def __iter__(self):
+        frontier = Frontier(self.strategy, self.priority)
+        self.seen.add(self.key(self.start))
+        frontier.push(self.start)
+        while frontier:
+            node = frontier.pop()
+            self.visited += 1
+            yield node
+            if self.max_states and self.visited >= self.max_states:
+                return
+            for child in self.expand(node):
+                frontier.push(child)
+
+    def find(self, goal):
+        """Return the first visited node for which goal(node) is true, None if there's none"""
+        return next((node for node in self if goal(node)), None)
+
+    def expand(self, node):
+        """Return the new nodes one move away from node, drop node's machine"""
+        comp = node.comp
+        node.comp = None
+        if comp is None or node.status is not Status.NEED_INPUT:
+            return []
+        moves = self.moves(node) if callable(self.moves) else self.moves
+        children = []
+        for move in moves:
+            child = comp.fork()
+            child.outputs = []
+            child.text_pos = 0
+            if isinstance(move, str):
+                child.send_line(move)
+            elif isinstance(move, int):
+                child.inputs.append(move)
+            else:
+                child.inputs.extend(move)
+            status = child.run(until={'input', 'halt'}, max_steps=self.budget)
+            if status is Status.BUDGET:
+                self.pruned += 1
+                continue
+            info = self.info(node, move, child.outputs) if self.info else None
+            child = Node(child, status, node, move, info)
+            if self.prune and self.prune(child):
+                self.pruned += 1
+                continue
+            key = self.key(child)
+            if key in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(key)
+            children.append(child)
+        return children
+
+class Frontier:
+    """Queue of nodes to visit, in the order of a search strategy"""
+    def __init__(self, strategy, priority=None):
+        self.strategy = strategy
+        self.priority = priority
+        self.nodes = [] if strategy == 'best' else deque()
+        self.count = 0  # tie breaker for equal priorities
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def push(self, node):
+        if self.strategy == 'best':
+            self.count += 1
+            heapq.heappush(self.nodes, (self.priority(node), self.count, node))
+        else:
+            self.nodes.append(node)
+
+    def pop(self):
+        if self.strategy == 'best':
+            return heapq.heappop(self.nodes)[2]
+        if self.strategy == 'dfs':
+            return self.nodes.pop()
+        return self.nodes.popleft()
@@ -0,0 +1,178 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from multiprocessing import Pool, cpu_count
+from intcode import Intcode, Status
+from intcode_cache import program_digest
+
+# Messages are JSON objects framed by their length as a 4-byte big-endian int.
+# Requests:
+#   {"op": "load", "program": [ints] or "text"}  ->  {"id": program id}
+#   {"op": "run", "id": program id, "inputs": [ints],
+#    "until": ["halt"], "max_steps": null}       ->  {"status": "halted", "outputs": [ints]}
+# Failed requests get {"error": message}.
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def recv_message(sock):
+    """Read a message, None if the connection was closed"""
+    header = recv_exactly(sock, 4)
+    if header is None:
+        return None
+    size, = struct.unpack('>I', header)
+    data = recv_exactly(sock, size)
+    if data is None:
+        return None
+    return json.loads(data)
+
+# per-process state of pool workers: program id -> machine stopped at its first input
+worker_machines = {}
+
+def run_job(program_id, state, inputs, until, max_steps):
+    """Run a job in a worker from the warm snapshot of its program
+
+    Returns (status value, outputs), or None if the worker doesn't hold
+    the program yet and state (the snapshot bytes) is None.
+    """
+    start = worker_machines.get(program_id)
+    if start is None:
+        if state is None:
+            return None
+        start = worker_machines[program_id] = Intcode.from_bytes(state)
+    comp = start.fork()
+    comp.inputs.extend(inputs)
+    status = comp.run(until=until, max_steps=max_steps)
+    return status.value, comp.outputs
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            request = recv_message(self.request)
+            if request is None:
+                return
+            try:
+                reply = self.server.dispatch(request)
+            except Exception as exc:
+                reply = {'error': f'{type(exc).__name__}: {exc}'}
+            send_message(self.request, reply)
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Local intcode execution service
+
+    Programs are loaded once: the server runs them up to their first input
+    and keeps a serialized snapshot (see Intcode.to_bytes). Runs are
+    executed by a pool of worker processes which deserialize a snapshot
+    the first time they see a program and fork it for every job after that.
+    Jobs only send the program id; a worker that doesn't hold the program
+    yet reports a miss, and the job is sent again with the snapshot.
+    Each client connection is served by a thread, so jobs of different
+    clients run in parallel.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, workers=None):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, Handler)
+        self.path = path
+        self.pool = Pool(workers or cpu_count())
+        self.states = {}  # program id -> snapshot bytes
+
+    def load(self, program):
+        if isinstance(program, str):
+            program = list(map(int, program.strip().split(',')))
+        program_id = program_digest(program)
+        if program_id not in self.states:
+            comp = Intcode(program)
+            comp.run(until={'input', 'halt'})
+            self.states[program_id] = comp.to_bytes()
+        return program_id
+
+    def dispatch(self, request):
+        op = request.get('op')
+        if op == 'load':
+            return {'id': self.load(request['program'])}
+        if op == 'run':
+            program_id = request['id']
+            assert program_id in self.states, f'Unknown program {program_id}!'
+            until = request.get('until', ['halt'])
+            assert set(until) <= {'input', 'output', 'halt'}, f'Invalid stop events {until}!'
+            job = request.get('inputs', []), until, request.get('max_steps')
+            result = self.pool.apply(run_job, (program_id, None, *job))
+            if result is None:
+                result = self.pool.apply(run_job, (program_id, self.states[program_id], *job))
+            status, outputs = result
+            return {'status': status, 'outputs': outputs}
+        assert False, f'Invalid op {op}!'
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+        self.pool.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+def serve_in_thread(path, workers=None):
+    """Start a server in a background thread, return it (call shutdown() and server_close() to stop)"""
+    server = Server(path, workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class Client:
+    """Connection to a Server"""
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, message):
+        send_message(self.sock, message)
+        reply = recv_message(self.sock)
+        if reply is None:
+            raise ConnectionError('Server closed the connection')
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def load(self, program):
+        """Send a program (list of ints or text), return its id"""
+        return self.request({'op': 'load', 'program': program})['id']
+
+    def run(self, program_id, inputs=(), until=('halt',), max_steps=None):
+        """Run a loaded program on inputs, return (Status, outputs)"""
+        reply = self.request({'op': 'run', 'id': program_id, 'inputs': list(inputs),
+                              'until': list(until), 'max_steps': max_steps})
+        return Status(reply['status']), reply['outputs']
+
+if __name__ == "__main__":
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else 'intcode.sock'
+    with Server(path) as server:
+        print(f'Serving intcode on {path}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from intcode import Profile, trace_header, trace_magic, trace_version, trace_fields, trace_table_fields
+
+# executed instructions with their addresses resolved, see load_trace
+trace_dtype = np.dtype([(name, '<i8') for name in ('ip', 'opcode', 'read1', 'read2', 'write', 'value')])
+
+def load_trace(path):
+    """Load a trace file written by Intcode.enable_tracing into a structured array
+
+    The file holds the decode table and (decoded row, base, value) records,
+    see intcode.Tracer. Here they're resolved into one record of
+    trace_dtype per executed instruction: ip, opcode, the addresses of the
+    two reads (-1 if immediate or absent), the address written (-1 if
+    none), and the value written or output. The result takes twice the
+    space of the records in the file.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(trace_header.size)
+        magic, version = trace_header.unpack(header)
+        assert magic == trace_magic, 'Not an intcode trace!'
+        assert version == trace_version, f'Unsupported trace version {version}!'
+        size = f.seek(0, os.SEEK_END)
+        f.seek(-8, os.SEEK_END)
+        num_rows = int(np.frombuffer(f.read(8), '<i8')[0])
+        table_size = 8 * len(trace_table_fields) * num_rows
+        records_size = size - 8 - table_size - trace_header.size
+        assert records_size >= 0 and records_size % (8 * len(trace_fields)) == 0, \
+            'Truncated trace, was the tracer closed?'
+        f.seek(size - 8 - table_size)
+        table = np.frombuffer(f.read(table_size), '<i8').reshape(num_rows, len(trace_table_fields))
+
+    num_records = records_size // (8 * len(trace_fields))
+    trace = np.zeros(num_records, dtype=trace_dtype)
+    if not num_records:
+        return trace
+    records = np.memmap(path, dtype='<i8', mode='r', offset=trace_header.size,
+                        shape=(num_records, len(trace_fields)))
+    rows = table[records[:, 0]]
+    base = records[:, 1]
+    trace['ip'] = rows[:, 0]
+    trace['opcode'] = rows[:, 1]
+    trace['read1'] = rows[:, 2] + rows[:, 3]*base
+    trace['read2'] = rows[:, 4] + rows[:, 5]*base
+    trace['write'] = rows[:, 6] + rows[:, 7]*base
+    trace['value'] = records[:, 2]
+    return trace
+
+def hot_loops(trace, top=10):
+    """Find the most frequently taken backward jumps
+
+    Returns a list of (start, end, iterations, instructions) for the top
+    loops, where start is the jump target, end the ip of the jump, and
+    instructions the number of executed instructions within [start, end].
+    """
+    ips = trace['ip']
+    jumps = np.flatnonzero(np.isin(trace['opcode'][:-1], (5, 6)) & (ips[1:] <= ips[:-1]))
+    if not len(jumps):
+        return []
+    edges, counts = np.unique(np.column_stack([ips[jumps + 1], ips[jumps]]), axis=0, return_counts=True)
+    loops = []
+    for k in np.argsort(counts)[::-1][:top]:
+        start, end = edges[k]
+        instructions = np.count_nonzero((ips >= start) & (ips <= end))
+        loops.append((int(start), int(end), int(counts[k]), int(instructions)))
+    return loops
+
+def first_write(trace, addr):
+    """Index of the first instruction writing to addr, None if it's never written"""
+    hits = trace['write'] == addr
+    k = int(hits.argmax()) if len(hits) else 0
+    return k if len(hits) and hits[k] else None
+
+def io_timeline(trace):
+    """List of (instruction index, 'in' or 'out', value) for every input and output"""
+    steps = np.flatnonzero(np.isin(trace['opcode'], (3, 4)))
+    records = trace[steps]
+    return [(int(step), Profile.opnames[int(opcode)], int(value))
+            for step,opcode,value in zip(steps, records['opcode'], records['value'])]